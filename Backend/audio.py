@@ -0,0 +1,143 @@
+import os
+import struct
+import tempfile
+import subprocess
+import numpy as np
+
+from scipy.io import wavfile
+from imageio_ffmpeg import get_ffmpeg_exe
+
+# Sample rate of the analysis track, whisper expects 16 kHz mono
+ANALYSIS_SAMPLE_RATE = 16000
+
+# Samples decoded at a time when audio is streamed from ffmpeg
+BLOCK_SAMPLES = 1 << 16
+
+# Size of the header of an analysis track, large enough for any length
+NPY_HEADER_BYTES = 128
+
+
+def extract_analysis_audio(media_path: str, output_path: str) -> str:
+    """
+    Decodes the audio of a media file once into its analysis track: mono float32 PCM at ANALYSIS_SAMPLE_RATE in a `.npy` file. Silence detection, transcription and every other stage map this file instead of decoding the media again, and worker processes mapping the same file share its pages through the page cache instead of each holding a private copy. The file is written block by block, so decoding takes constant memory.
+
+    Args:
+        media_path (str): The path to the video or audio file.
+        output_path (str): The path of the `.npy` file to write.
+
+    Returns:
+        str: The path to the analysis track.
+
+    Raises:
+        RuntimeError: If ffmpeg cannot decode the media file.
+    """
+    partial = f"{output_path}.part"
+    length = 0
+    with open(partial, "wb") as file:
+        # The header is rewritten with the real length once it is known
+        file.write(_npy_header(0))
+        for block in pcm_blocks(media_path):
+            file.write(block.astype("<f4", copy=False).tobytes())
+            length += len(block)
+        file.seek(0)
+        file.write(_npy_header(length))
+    os.replace(partial, output_path)
+    return output_path
+
+
+def _npy_header(length: int) -> bytes:
+    # A fixed-size NPY 1.0 header of a 1-d little-endian float32 array
+    header = f"{{'descr': '<f4', 'fortran_order': False, 'shape': ({length},), }}"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", NPY_HEADER_BYTES - 10) + header.ljust(NPY_HEADER_BYTES - 11).encode("latin1") + b"\n"
+
+
+def pcm_blocks(media_path: str, sample_rate: int = ANALYSIS_SAMPLE_RATE, block_samples: int = BLOCK_SAMPLES):
+    """
+    Decodes the audio of a media file as mono PCM piped from ffmpeg, block by block, so only one block is held in memory no matter how long the file is. Analysis tracks written by `extract_analysis_audio` are read from the mapped file without decoding.
+
+    Args:
+        media_path (str): The path to the video or audio file.
+        sample_rate (int): The sample rate to decode at.
+        block_samples (int): The number of samples per block.
+
+    Yields:
+        np.ndarray: The next block of float32 samples in [-1, 1]; the last one may be shorter.
+
+    Raises:
+        RuntimeError: If ffmpeg cannot decode the media file.
+    """
+    if media_path.endswith(".npy") and sample_rate == ANALYSIS_SAMPLE_RATE:
+        samples, _ = load_analysis_audio(media_path)
+        for start in range(0, len(samples), block_samples):
+            yield samples[start:start + block_samples]
+        return
+
+    command = [
+        get_ffmpeg_exe(), "-nostdin", "-loglevel", "error",
+        "-i", media_path,
+        "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "f32le", "-",
+    ]
+    # A file instead of a pipe, so a stream of decode errors can never block ffmpeg
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=log)
+    try:
+        while True:
+            data = process.stdout.read(block_samples * 4)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) // 4 * 4], dtype="<f4")
+        if process.wait() != 0:
+            log.seek(0)
+            raise RuntimeError(f"ffmpeg could not decode the audio of {media_path}: {log.read().decode(errors='replace').strip()}")
+    finally:
+        # The consumer may stop early
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        log.close()
+
+
+def load_analysis_audio(audio_path: str) -> tuple:
+    """
+    Maps an analysis track written by `extract_analysis_audio`. Nothing is read until it is used, and slices of the samples are views of the file.
+
+    Args:
+        audio_path (str): The path to the `.npy` file.
+
+    Returns:
+        tuple: The read-only float32 samples in [-1, 1] and the sample rate.
+    """
+    return np.load(audio_path, mmap_mode="r"), ANALYSIS_SAMPLE_RATE
+
+
+def audio_slice(samples: np.ndarray, sample_rate: int, start: float, end: float) -> np.ndarray:
+    """
+    Cuts a time range out of an analysis track.
+
+    Args:
+        samples (np.ndarray): The samples of the track.
+        sample_rate (int): The sample rate of the track.
+        start (float): The start of the range in seconds.
+        end (float): The end of the range in seconds.
+
+    Returns:
+        np.ndarray: The samples of the range, a view of the track rather than a copy.
+    """
+    return samples[max(0, round(start * sample_rate)):max(0, round(end * sample_rate))]
+
+
+def write_wav(samples: np.ndarray, sample_rate: int, path: str) -> str:
+    """
+    Writes samples to a 16-bit PCM WAV file, e.g. for services that need a file to upload.
+
+    Args:
+        samples (np.ndarray): The float32 samples in [-1, 1].
+        sample_rate (int): The sample rate of the samples.
+        path (str): The path of the WAV file to write.
+
+    Returns:
+        str: The path to the WAV file.
+    """
+    wavfile.write(path, sample_rate, (np.clip(samples, -1, 1) * 32767).astype(np.int16))
+    return path
@@ -0,0 +1,145 @@
+import os
+import time
+import hashlib
+import threading
+import requests
+
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from termcolor import colored
+from dotenv import load_dotenv
+
+load_dotenv("../.env")
+
+# Files downloaded at the same time by `download_all`
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "4"))
+
+# Attempts after a failed or interrupted download, each resuming where the previous one stopped
+DOWNLOAD_RETRIES = int(os.getenv("DOWNLOAD_RETRIES", "3"))
+
+# Bytes held in memory at a time while streaming a download to disk
+CHUNK_BYTES = 1024 * 1024
+
+# Connect and read timeouts in seconds
+TIMEOUT = (10, 60)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class DownloadError(Exception):
+    """
+    Raised when a download fails after all retries or does not match its checksum.
+    """
+
+
+def session() -> requests.Session:
+    """
+    Returns the HTTP session shared by every download of this process, so connections to the same host are pooled and reused.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=DOWNLOAD_CONCURRENCY, pool_maxsize=DOWNLOAD_CONCURRENCY * 2)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def download(url: str, path: str, sha256: str = None, retries: int = DOWNLOAD_RETRIES) -> str:
+    """
+    Streams a file to disk in chunks of CHUNK_BYTES, so memory stays flat regardless of its size. The file is written to `<path>.part` first; an interrupted download is resumed with an HTTP Range request, and the result is checked against its Content-Length and, if given, its SHA-256 before it is moved to `path`.
+
+    Args:
+        url (str): The URL of the file.
+        path (str): The path to save the file to.
+        sha256 (str): Optional expected SHA-256 of the file.
+        retries (int): Attempts after a failure, each resuming the partial file.
+
+    Returns:
+        str: The path to the downloaded file.
+
+    Raises:
+        DownloadError: If the download keeps failing or the file does not match its checksum.
+    """
+    part = f"{path}.part"
+    for attempt in range(retries + 1):
+        try:
+            digest = _fetch(url, part)
+            break
+        except (requests.RequestException, DownloadError) as e:
+            status = e.response.status_code if isinstance(e, requests.HTTPError) else None
+            # Client errors other than timeouts and rate limits do not go away by retrying
+            if attempt == retries or (status and 400 <= status < 500 and status not in (408, 429)):
+                raise DownloadError(f"Could not download {url}: {e}") from e
+            print(colored(f"[-] Download of {url} failed ({e}), retrying", "yellow"))
+            time.sleep(2 ** attempt)
+
+    if sha256 and digest != sha256.lower():
+        os.remove(part)
+        raise DownloadError(f"{url} does not match its checksum.")
+    os.replace(part, path)
+    return path
+
+
+def download_all(downloads: list, concurrency: int = DOWNLOAD_CONCURRENCY) -> list:
+    """
+    Downloads several files in parallel over the shared session.
+
+    Args:
+        downloads (list): (url, path) or (url, path, sha256) tuples.
+        concurrency (int): Files downloaded at the same time.
+
+    Returns:
+        list: The paths to the downloaded files, in the order of `downloads`.
+
+    Raises:
+        DownloadError: If one of the downloads fails.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(downloads)))) as executor:
+        return list(executor.map(lambda item: download(*item), downloads))
+
+
+def _fetch(url: str, part: str) -> str:
+    # Appends the rest of the file to the partial download and returns the SHA-256 of the whole file
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with session().get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code == 416:
+            # The partial file already is the whole file
+            return _digest_file(part).hexdigest()
+        response.raise_for_status()
+        if response.status_code != 206 or not response.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+            # The server ignored the range, start over
+            offset = 0
+        expected = response.headers.get("Content-Length")
+        expected = offset + int(expected) if expected and "Content-Encoding" not in response.headers else None
+
+        digest = _digest_file(part, offset) if offset else hashlib.sha256()
+        with open(part, "ab" if offset else "wb") as file:
+            for chunk in response.iter_content(CHUNK_BYTES):
+                file.write(chunk)
+                digest.update(chunk)
+
+    size = os.path.getsize(part)
+    if expected is not None and size != expected:
+        raise DownloadError(f"received {size} of {expected} bytes")
+    return digest.hexdigest()
+
+
+def _digest_file(path: str, limit: int = None):
+    # Running SHA-256 of the first `limit` bytes (or all) of a file
+    digest = hashlib.sha256()
+    remaining = os.path.getsize(path) if limit is None else limit
+    with open(path, "rb") as file:
+        while remaining > 0:
+            block = file.read(min(CHUNK_BYTES, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest
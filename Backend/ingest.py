@@ -0,0 +1,406 @@
+import os
+import json
+import yt_dlp
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from yt_dlp.utils import DownloadCancelled, download_range_func, parse_duration
+
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from termcolor import colored
+from dotenv import load_dotenv
+from source_cache import SourceCache, cache_key, link_into
+from audio import ANALYSIS_SAMPLE_RATE, extract_analysis_audio
+from uploads import UPLOAD_EXTRACTOR, uploaded_file
+
+load_dotenv("../.env")
+
+# Longest source (in seconds) a job may be submitted for, 0 disables the check
+MAX_SOURCE_SECONDS = float(os.getenv("MAX_SOURCE_SECONDS", "14400"))
+
+# Height of the 9:16 crop a source has to cover; 1920 renders the 1080x1920 output without any upscaling
+SOURCE_TARGET_HEIGHT = int(os.getenv("SOURCE_TARGET_HEIGHT", "1080"))
+
+# Frame rate of the rendered clips; faster sources only cost decode time
+RENDER_FPS = 30
+
+# Video codecs by how fast ffmpeg decodes them, unlisted codecs come last
+CODEC_PREFERENCE = ("avc1", "h264", "vp9", "vp09", "av01")
+
+
+def _crop_height(video_format: dict) -> float:
+    # Height of the largest 9:16 crop of the format
+    width, height = video_format.get("width"), video_format["height"]
+    return min(height, width * 16 / 9) if width else height
+
+
+def _codec_rank(video_format: dict) -> int:
+    codec = (video_format.get("vcodec") or "").lower()
+    return next((rank for rank, prefix in enumerate(CODEC_PREFERENCE) if codec.startswith(prefix)), len(CODEC_PREFERENCE))
+
+
+def pick_video_format(formats: list) -> dict:
+    """
+    Picks the cheapest video format that still covers the render target: the smallest one whose 9:16 crop is at least SOURCE_TARGET_HEIGHT tall, preferring at most RENDER_FPS frames per second, fast-decoding codecs and lower bitrates. Sources that never reach the target get their largest format.
+
+    Args:
+        formats (list): The formats reported by yt_dlp.
+
+    Returns:
+        dict: The chosen format, or None if the source has no video format with a known height.
+    """
+    videos = [f for f in formats if f.get("vcodec") != "none" and f.get("height")]
+    if not videos:
+        return None
+    covering = [f for f in videos if _crop_height(f) >= SOURCE_TARGET_HEIGHT]
+    if not covering:
+        largest = max(_crop_height(f) for f in videos)
+        covering = [f for f in videos if _crop_height(f) == largest]
+    return min(covering, key=lambda f: (
+        _crop_height(f),
+        (f.get("fps") or 0) > RENDER_FPS,
+        _codec_rank(f),
+        f.get("tbr") or 0,
+    ))
+
+
+def select_video_format(ctx: dict):
+    """
+    yt_dlp format selector downloading the format chosen by `pick_video_format`, merged with the best matching audio if it is video-only.
+
+    Args:
+        ctx (dict): The selection context passed by yt_dlp.
+
+    Yields:
+        dict: The format to download.
+    """
+    formats = ctx["formats"]
+    video = pick_video_format(formats)
+    if video is None:
+        # Nothing to compare, take the best muxed format (yt_dlp sorts them worst first)
+        muxed = [f for f in formats if f.get("vcodec") != "none" and f.get("acodec") != "none"]
+        if muxed:
+            yield muxed[-1]
+        return
+    if video.get("acodec") not in (None, "none"):
+        yield video
+        return
+
+    audios = [f for f in formats if f.get("acodec") != "none" and f.get("vcodec") == "none"]
+    if not audios:
+        yield video
+        return
+    # Audio in the video's container can be merged without changing the extension
+    same_container = {"mp4": "m4a", "webm": "webm"}.get(video["ext"])
+    audio = max(audios, key=lambda f: (f["ext"] == same_container, f.get("abr") or 0))
+    yield {
+        "format_id": f"{video['format_id']}+{audio['format_id']}",
+        "ext": video["ext"] if audio["ext"] == same_container else "mkv",
+        "requested_formats": [video, audio],
+        "protocol": f"{video['protocol']}+{audio['protocol']}",
+    }
+
+
+# yt_dlp options, file name suffix and cache key of the two tracks a source is fetched as
+TRACKS = {
+    "audio": {
+        "options": {'format': 'bestaudio/best'},
+        "suffix": ".audio",
+        "key": ("audio", "npy", str(ANALYSIS_SAMPLE_RATE)),
+    },
+    "video": {
+        "options": {'format': select_video_format},
+        "suffix": "",
+        "key": ("video", str(SOURCE_TARGET_HEIGHT)),
+    },
+}
+
+
+class SourceTooLong(Exception):
+    """
+    Raised when a source is longer than MAX_SOURCE_SECONDS.
+    """
+
+
+def probe_source(video_url: str) -> dict:
+    """
+    Fetches the metadata of a video without downloading it.
+
+    Args:
+        video_url (str): The URL of the video.
+
+    Returns:
+        dict: The 'extractor', 'id' and 'duration' (seconds) of the video, the 'width', 'height' and 'fps' of the format `pick_video_format` chooses and whether the video is a 'live' stream; values yt_dlp does not report are None.
+    """
+    with yt_dlp.YoutubeDL({'quiet': True, 'skip_download': True, 'noplaylist': True}) as ydl:
+        info = ydl.extract_info(video_url, download=False)
+
+    # Report the format that will be downloaded, not the best one
+    video = pick_video_format(info.get('formats') or []) or info
+    return {
+        "extractor": info.get('extractor_key') or info.get('extractor'),
+        "id": info.get('id'),
+        "duration": info.get('duration'),
+        "width": video.get('width'),
+        "height": video.get('height'),
+        "fps": video.get('fps'),
+        "live": bool(info.get('is_live')),
+    }
+
+
+def source_key(video_url: str, source: dict = None) -> str:
+    """
+    Identifies a video independently of how its URL is written, e.g. youtu.be links, extra query parameters or timestamps.
+
+    Args:
+        video_url (str): The URL of the video.
+        source (dict): The probed source, as returned by `probe_source`.
+
+    Returns:
+        str: 'extractor:id' for probed videos, otherwise the normalized URL.
+    """
+    if source and source.get("extractor") and source.get("id"):
+        return f"{source['extractor'].lower()}:{source['id']}"
+
+    parts = urlsplit(video_url.strip())
+    host = parts.netloc.lower().removeprefix("www.")
+    query = sorted((key, value) for key, value in parse_qsl(parts.query) if key not in ("t", "si", "feature") and not key.startswith("utm_"))
+    return f"{host}{parts.path.rstrip('/')}?{urlencode(query)}"
+
+
+def parse_ranges(data: dict, source: dict) -> list:
+    """
+    Reads the time ranges of a request: either 'start'/'end' or a list of 'ranges' of {'start', 'end'} objects or [start, end] pairs, in seconds or as '[HH:]MM:SS' strings. A missing end means the end of the video.
+
+    Args:
+        data (dict): The request payload.
+        source (dict): The probed source, as returned by `probe_source`.
+
+    Returns:
+        list: The sorted, merged [start, end] ranges in seconds, or None if the whole video is requested.
+
+    Raises:
+        ValueError: If a range is malformed, empty or outside the video.
+    """
+    if data.get("ranges") is not None:
+        if not isinstance(data["ranges"], list) or not data["ranges"]:
+            raise ValueError("ranges must be a non-empty list.")
+        requested = []
+        for item in data["ranges"]:
+            if isinstance(item, dict):
+                requested.append((item.get("start"), item.get("end")))
+            elif isinstance(item, (list, tuple)) and len(item) == 2:
+                requested.append(tuple(item))
+            else:
+                raise ValueError("Every range needs a start and an end.")
+    elif data.get("start") is not None or data.get("end") is not None:
+        requested = [(data.get("start"), data.get("end"))]
+    else:
+        return None
+
+    if source.get("live"):
+        raise ValueError("Ranges cannot be requested for live streams.")
+    if source.get("extractor") == UPLOAD_EXTRACTOR:
+        raise ValueError("Ranges cannot be requested for uploaded files, upload only the part to process.")
+    duration = source.get("duration")
+    ranges = []
+    for item in requested:
+        if len(item) != 2:
+            raise ValueError("Every range needs a start and an end.")
+        start = _parse_time(item[0]) if item[0] is not None else 0.0
+        end = _parse_time(item[1]) if item[1] is not None else duration
+        if end is None:
+            raise ValueError("The video's duration is unknown, every range needs an end.")
+        if duration:
+            end = min(end, duration)
+        if start < 0 or end <= start:
+            raise ValueError(f"The range {item[0]}-{item[1]} is empty or outside the video.")
+        ranges.append([start, end])
+
+    # Overlapping ranges are downloaded once
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _parse_time(value) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    seconds = parse_duration(value) if isinstance(value, str) else None
+    if seconds is None:
+        raise ValueError(f"{value!r} is not a time in seconds or [HH:]MM:SS.")
+    return float(seconds)
+
+
+def check_source_duration(source: dict, ranges: list = None) -> None:
+    """
+    Rejects sources that are longer than MAX_SOURCE_SECONDS. Only the requested ranges count when there are any.
+
+    Args:
+        source (dict): The probed source, as returned by `probe_source`.
+        ranges (list): The requested [start, end] ranges, as returned by `parse_ranges`.
+
+    Raises:
+        SourceTooLong: If the source is too long.
+    """
+    duration = sum(end - start for start, end in ranges) if ranges else source.get("duration")
+    if MAX_SOURCE_SECONDS and duration and duration > MAX_SOURCE_SECONDS:
+        what = "requested part of the video" if ranges else "video"
+        raise SourceTooLong(f"The {what} is {duration / 60:.0f} minutes long, the limit is {MAX_SOURCE_SECONDS / 60:.0f} minutes.")
+
+
+class SourceDownload:
+    """
+    Fetches the audio and the video track of a source concurrently. The audio track is small and arrives first as a mono PCM analysis track, so silence detection and transcription can start while the video is still downloading. Probed sources are served from the persistent source cache, so a track is only downloaded once no matter how many jobs clip it. Uploaded files (see `uploads.py`) come from the cache as well and only need their analysis track.
+
+    When time ranges are requested only those are downloaded, one file per range and track. Every track is returned as a list of 'sections' with the 'start' and 'end' of the range in source time; times inside a section's files are relative to its start.
+    """
+
+    def __init__(self, video_url: str, directory: str, source: dict = None, progress_hook=None, ranges: list = None) -> None:
+        """
+        Args:
+            video_url (str): The URL of the video.
+            directory (str): The directory the job reads the files from.
+            source (dict): The probed source, as returned by `probe_source`; without an extractor and ID the cache is bypassed.
+            progress_hook (Callable): Optional hook called with every yt_dlp status and the track ('audio' or 'video') it belongs to.
+            ranges (list): Optional [start, end] ranges in seconds, as returned by `parse_ranges`.
+        """
+        self.video_url = video_url
+        self.directory = directory
+        self.source = source
+        self.progress_hook = progress_hook
+        self.ranges = ranges
+        self._executor = ThreadPoolExecutor(max_workers=len(TRACKS))
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+    def start(self, track: str) -> None:
+        """
+        Starts fetching a track in the background unless it is already being fetched.
+
+        Args:
+            track (str): 'audio' or 'video'.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if track not in self._futures:
+                self._futures[track] = self._executor.submit(self._fetch, track)
+
+    def audio(self) -> dict:
+        """
+        Waits for the audio track.
+
+        Returns:
+            dict: The 'video_id' and 'info_path' of the source, its 'sections' with their 'audio_path' and whether it was 'cached'.
+        """
+        self.start("audio")
+        return self._futures["audio"].result()
+
+    def video(self) -> dict:
+        """
+        Waits for the video track.
+
+        Returns:
+            dict: The 'video_id' of the source, its 'sections' with their 'video_path' and whether it was 'cached'.
+        """
+        self.start("video")
+        return self._futures["video"].result()
+
+    def cancel(self) -> None:
+        """
+        Aborts the downloads that are still running, e.g. when the job fails or is cancelled before it needs them.
+
+        Returns:
+            None
+        """
+        self._cancelled.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _fetch(self, track: str) -> dict:
+        source = self.source or {}
+        if source.get("extractor") == UPLOAD_EXTRACTOR and track == "video":
+            # An uploaded file already is the video track
+            files = {"video_0": link_into(uploaded_file(source["id"]), self.directory)}
+            return _track_result(track, files, {"video_id": source["id"], "sections": [{"start": 0.0, "end": None}]}, cached=True)
+        if not source.get("extractor") or not source.get("id"):
+            files, meta = self._download(track)
+            return _track_result(track, files, meta, cached=False)
+
+        cache = SourceCache()
+        key = cache_key(source["extractor"].lower(), source["id"], *TRACKS[track]["key"], json.dumps(self.ranges))
+        # Jobs for the same source wait for the first download instead of repeating it
+        with cache.lock(key):
+            entry = cache.get(key)
+            cached = entry is not None
+            if not cached:
+                files, meta = self._download(track)
+                entry = cache.put(key, files, meta=dict(meta, url=self.video_url))
+            else:
+                print(colored(f"[+] Using cached {track} track {key}", "green"))
+
+            files = {name: link_into(path, self.directory) for name, path in entry["files"].items()}
+            return _track_result(track, files, entry["meta"], cached)
+
+    def _download(self, track: str) -> tuple:
+        if (self.source or {}).get("extractor") == UPLOAD_EXTRACTOR:
+            # Only the analysis track of an uploaded file has to be made
+            video_id = self.source["id"]
+            path = extract_analysis_audio(uploaded_file(video_id), f"{self.directory}/{video_id}.0.npy")
+            return {"audio_0": path}, {"video_id": video_id, "sections": [{"start": 0.0, "end": None}]}
+
+        def hook(status):
+            # yt_dlp stops the download when a progress hook raises
+            if self._cancelled.is_set():
+                raise DownloadCancelled()
+            if self.progress_hook is not None:
+                self.progress_hook(status, track)
+
+        name = f"%(id)s{TRACKS[track]['suffix']}"
+        ydl_opts = dict(TRACKS[track]["options"], progress_hooks=[hook])
+        if self.ranges:
+            name += ".%(section_start)s"
+            ydl_opts["download_ranges"] = download_range_func(None, [tuple(r) for r in self.ranges])
+            # Cut the video exactly at the range boundaries so it lines up with the audio
+            ydl_opts["force_keyframes_at_cuts"] = track == "video"
+        ydl_opts["outtmpl"] = f"{self.directory}/{name}.%(ext)s"
+
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(self.video_url, download=True)
+            video_id = info.get('id', None)
+            downloads = info.get('requested_downloads') or [info]
+            paths = [download.get('filepath') or ydl.prepare_filename(download) for download in downloads]
+            sections = [{"start": download.get('section_start') or 0.0, "end": download.get('section_end')} for download in downloads]
+
+            files = {}
+            if track == "audio":
+                files["info"] = f"{self.directory}/{video_id}.info.json"
+                with open(files["info"], "w") as file:
+                    json.dump(ydl.sanitize_info(info), file)
+
+        for index, path in enumerate(paths):
+            if track == "audio":
+                # The download is decoded once; everything after reads the PCM track
+                files[f"audio_{index}"] = extract_analysis_audio(path, f"{self.directory}/{video_id}.{index}.npy")
+                os.remove(path)
+            else:
+                files[f"video_{index}"] = path
+        return files, {"video_id": video_id, "sections": sections}
+
+
+def _track_result(track: str, files: dict, meta: dict, cached: bool) -> dict:
+    sections = [
+        dict(section, **{f"{track}_path": files[f"{track}_{index}"]})
+        for index, section in enumerate(meta["sections"])
+    ]
+    result = {"video_id": meta["video_id"], "sections": sections, "cached": cached}
+    if "info" in files:
+        result["info_path"] = files["info"]
+    return result
@@ -0,0 +1,809 @@
+import os
+import json
+import math
+import time
+import uuid
+import threading
+import multiprocessing
+
+from multiprocessing.connection import wait
+
+import psutil
+from dotenv import load_dotenv
+from termcolor import colored
+from utils import remove_job_dir
+from progress import ProgressReporter
+from store import JobStore, JobCheckpoints
+from scheduler import PRIORITIES, CostModel, schedule_key
+from ingest import source_key
+
+load_dotenv("../.env")
+
+# Number of render worker processes pulling jobs from the queue
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "2"))
+
+# Maximum number of jobs rendering at the same time (at most WORKER_COUNT)
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", str(WORKER_COUNT)))
+
+# Maximum number of jobs waiting for a worker before new submissions are rejected
+MAX_QUEUE_DEPTH = int(os.getenv("MAX_QUEUE_DEPTH", "20"))
+
+# Seconds a running job gets to stop on its own after a cancel before its worker is killed
+CANCEL_GRACE_SECONDS = float(os.getenv("CANCEL_GRACE_SECONDS", "1.5"))
+
+# Number of times a job is started before a crash of its worker fails it
+MAX_ATTEMPTS = int(os.getenv("MAX_ATTEMPTS", "3"))
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+# Job parameters that change the rendered output or how it is delivered; identical in-flight requests share one job
+RENDER_PARAMS = ("strokeColor", "fontOutline", "fontSize", "captions", "jumpCut", "progressive", "live")
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside the pipeline when the job it is running has been cancelled.
+    """
+
+
+class QueueFull(Exception):
+    """
+    Raised when a job is submitted while MAX_QUEUE_DEPTH jobs are already waiting.
+    """
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"The queue is full, retry in {retry_after} seconds.")
+        self.retry_after = retry_after
+
+
+class CancelToken:
+    """
+    Cooperative cancellation flag shared between the API process and a worker process.
+    """
+
+    def __init__(self, event) -> None:
+        self._event = event
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        """
+        Stops the current job if it has been cancelled.
+
+        Raises:
+            JobCancelled: If cancellation has been requested.
+        """
+        if self._event.is_set():
+            raise JobCancelled()
+
+
+def dedup_key(params: dict) -> str:
+    """
+    Builds the key under which identical requests are coalesced: the normalized video, the requested ranges of it plus every render parameter.
+
+    Args:
+        params (dict): The job parameters.
+
+    Returns:
+        str: The deduplication key.
+    """
+    render = {name: str(params.get(name)) for name in RENDER_PARAMS}
+    return json.dumps([source_key(params["videoUrl"], params.get("source")), params.get("ranges"), render], sort_keys=True)
+
+
+def kill_child_processes(pid: int) -> None:
+    """
+    Kills every process spawned by a process, such as the ffmpeg readers and writers started by moviepy.
+
+    Args:
+        pid (int): The ID of the parent process.
+
+    Returns:
+        None
+    """
+    try:
+        processes = psutil.Process(pid).children(recursive=True)
+    except psutil.NoSuchProcess:
+        return
+    for process in processes:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+    psutil.wait_procs(processes, timeout=1)
+
+
+class Job:
+    """
+    A single unit of work submitted to the generation pipeline.
+    """
+
+    def __init__(self, params: dict, job_id: str = None, created_at: float = None) -> None:
+        self.id = job_id or uuid.uuid4().hex
+        self.params = params
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.worker = None
+        self.cancel_requested_at = None
+        self.created_at = created_at or time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.attempts = 0
+        self.events = []
+        self.last_event_id = 0
+        self.stage = None
+        self.stage_started_at = None
+        self.stage_timings = {}
+        self.segments = None
+        self.eta = None
+        self.dedup_key = dedup_key(params)
+        self.subscriptions = set()
+
+    def add_event(self, event: dict) -> None:
+        """
+        Appends an event to the job's event log. Progress events replace the previous event of the same bar as long as only progress was reported in between, so the log stays small.
+
+        Args:
+            event (dict): The event.
+
+        Returns:
+            None
+        """
+        self.last_event_id += 1
+        event["id"] = self.last_event_id
+        if event["type"] == "analysis":
+            self.segments = event["segments"]
+        if event["type"] == "stage":
+            self.stage = event["stage"]
+            self.stage_started_at = event["time"] if event["status"] == "started" else None
+            if event["status"] == "finished":
+                self.stage_timings[event["stage"]] = self.stage_timings.get(event["stage"], 0) + event["elapsed"]
+        if event["type"] == "progress":
+            # Look past the progress of other bars, e.g. downloads running in parallel
+            for index in range(len(self.events) - 1, -1, -1):
+                last = self.events[index]
+                if last["type"] != "progress":
+                    break
+                if last["stage"] == event["stage"] and last["bar"] == event["bar"]:
+                    del self.events[index]
+                    break
+        self.events.append(event)
+
+    @classmethod
+    def from_row(cls, row: dict) -> "Job":
+        """
+        Rebuilds a job from its row in the job store.
+
+        Args:
+            row (dict): The job as returned by `JobStore.load_job`.
+
+        Returns:
+            Job: The job.
+        """
+        job = cls(row["params"], job_id=row["id"], created_at=row["created_at"])
+        job.state = row["state"]
+        job.result = row["result"]
+        job.error = row["error"]
+        job.stage_timings = row["stage_timings"]
+        # Events of a resumed job are numbered on from where its clients stopped
+        job.last_event_id = row["last_event_id"]
+        job.attempts = row["attempts"]
+        job.subscriptions = set(row["subscriptions"])
+        job.started_at = row["started_at"]
+        job.finished_at = row["finished_at"]
+        return job
+
+    def subscribe(self) -> str:
+        """
+        Registers a request waiting for the job.
+
+        Returns:
+            str: The subscription token the request cancels with.
+        """
+        subscription = uuid.uuid4().hex
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def final_event(self) -> dict:
+        """
+        Returns the event that reported how the job ended, rebuilt for jobs that finished before the last restart.
+
+        Returns:
+            dict: The 'state' event of the finished job.
+        """
+        for event in reversed(self.events):
+            if event["type"] == "state" and event["state"] in FINISHED_STATES:
+                return event
+        return {"type": "state", "state": self.state, "time": self.finished_at, "id": self.last_event_id}
+
+    def to_dict(self) -> dict:
+        """
+        Serializes the job for the status API.
+
+        Returns:
+            dict: The public representation of the job.
+        """
+        return {
+            "jobId": self.id,
+            "state": self.state,
+            "stage": self.stage,
+            "stageTimings": self.stage_timings,
+            "eta": self.eta,
+            "params": self.params,
+            "result": self.result,
+            "error": self.error,
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+        }
+
+
+def _kill_children_on_cancel(cancel_event) -> None:
+    # Runs in a worker thread: as long as the current job is cancelled, any
+    # ffmpeg subprocess it has (or is about to have) running gets killed.
+    while True:
+        cancel_event.wait()
+        kill_child_processes(os.getpid())
+        time.sleep(0.2)
+
+
+class _EventPipe:
+    """
+    Worker-side end of a worker's event pipe. Downloads report progress from their own threads, so sends are serialized.
+    """
+
+    def __init__(self, connection) -> None:
+        self._connection = connection
+        self._lock = threading.Lock()
+
+    def put(self, item: tuple) -> None:
+        """
+        Sends an event to the API process.
+
+        Args:
+            item (tuple): The (kind, job_id, worker_id, payload) event.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._connection.send(item)
+
+
+def _worker_main(worker_id: int, inbox, connection, cancel_event) -> None:
+    """
+    Entry point of a worker process. Pulls jobs from its inbox, runs them through the pipeline and reports back on its own event pipe.
+
+    Args:
+        worker_id (int): The index of the worker in the pool.
+        inbox (multiprocessing.Queue): Queue of (job_id, params) tuples, or None to stop.
+        connection (multiprocessing.connection.Connection): Sending end of the pipe the worker reports job events to.
+        cancel_event (multiprocessing.Event): Set by the API process when the current job is cancelled.
+
+    Returns:
+        None
+    """
+    # Imported here so the API process never loads the heavy media stack
+    import pipeline
+
+    try:
+        pipeline.warm_up()
+    except Exception as e:
+        print(colored(f"[-] Worker {worker_id} could not preload models: {e}", "yellow"))
+    store = JobStore()
+    events = _EventPipe(connection)
+    token = CancelToken(cancel_event)
+    threading.Thread(target=_kill_children_on_cancel, args=(cancel_event,), daemon=True).start()
+
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+
+        job_id, params = item
+        events.put(("started", job_id, worker_id, None))
+        progress = ProgressReporter(job_id, worker_id, events)
+        try:
+            result = pipeline.run_job(job_id, params, token, progress, JobCheckpoints(store, job_id))
+            progress.finish_stage()
+            events.put(("succeeded", job_id, worker_id, result))
+        except Exception as e:
+            if token.cancelled:
+                print(colored(f"[-] [{job_id}] Job cancelled", "yellow"))
+                events.put(("cancelled", job_id, worker_id, None))
+                continue
+            print(colored(f"[-] [{job_id}] Job failed: {e}", "red"))
+            events.put(("failed", job_id, worker_id, str(e)))
+
+
+class _Worker:
+    """
+    Parent-side handle on a worker process. Every worker reports on a pipe of its own that is discarded with it, so a worker killed in the middle of a send cannot leave a lock or half a message behind for the others.
+    """
+
+    def __init__(self, worker_id: int, context) -> None:
+        self.id = worker_id
+        self.inbox = context.Queue()
+        self.cancel_event = context.Event()
+        self.job_id = None
+        self.events, sender = context.Pipe(duplex=False)
+        self.process = context.Process(
+            target=_worker_main,
+            args=(worker_id, self.inbox, sender, self.cancel_event),
+            name=f"stream2clip-worker-{worker_id}",
+            daemon=True,
+        )
+        self.process.start()
+        # Only the worker holds the sending end, so the pipe reports EOF once it exits
+        sender.close()
+
+    def receive(self) -> list:
+        """
+        Reads the events the worker has sent so far without blocking.
+
+        Returns:
+            list: The (kind, job_id, worker_id, payload) events.
+        """
+        received = []
+        try:
+            while self.events.poll():
+                received.append(self.events.recv())
+        except (EOFError, OSError):
+            # The worker has exited, possibly in the middle of a send; it is replaced by `_reap_workers`
+            pass
+        return received
+
+
+class JobManager:
+    """
+    Owns the job table, the pending queue and the pool of worker processes. A dispatcher thread hands queued jobs to idle workers and applies the events they report.
+    """
+
+    def __init__(self, worker_count: int = WORKER_COUNT, store: JobStore = None) -> None:
+        self.worker_count = max(1, worker_count)
+        self.max_concurrent = max(1, min(MAX_CONCURRENT_JOBS, self.worker_count))
+        self._store = store or JobStore()
+        self._cost_model = CostModel()
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._jobs = {}
+        self._pending = []
+        self._inflight = {}
+        self._workers = []
+        self._running = False
+
+    def start(self) -> None:
+        """
+        Spawns the worker processes and the dispatcher thread.
+
+        Returns:
+            None
+        """
+        if self._running:
+            return
+        self._running = True
+        self._update_cost_model()
+        self._resume_jobs()
+        self._workers = [_Worker(i, self._context) for i in range(self.worker_count)]
+        threading.Thread(target=self._dispatch_loop, name="stream2clip-dispatcher", daemon=True).start()
+        print(colored(f"[+] Started {self.worker_count} render workers", "green"))
+
+    def stop(self) -> None:
+        """
+        Asks every worker to exit once its current job is done.
+
+        Returns:
+            None
+        """
+        self._running = False
+        for worker in self._workers:
+            worker.inbox.put(None)
+
+    def submit(self, params: dict) -> tuple:
+        """
+        Queues a new job, unless an identical job (same video and render parameters) is already queued or running, in which case the caller joins that job.
+
+        Args:
+            params (dict): The job parameters.
+
+        Returns:
+            tuple: The job, the caller's subscription token to cancel with and whether it is an existing in-flight job.
+
+        Raises:
+            QueueFull: If MAX_QUEUE_DEPTH jobs are already waiting.
+        """
+        with self._lock:
+            job = self._join_inflight(params)
+            if job is not None:
+                subscription = job.subscribe()
+                self._store.save_job(job)
+                return job, subscription, True
+            if len(self._pending) >= MAX_QUEUE_DEPTH:
+                raise QueueFull(self._retry_after())
+            job = Job(params)
+            subscription = job.subscribe()
+            self._enqueue(job)
+        return job, subscription, False
+
+    def _enqueue(self, job: Job) -> None:
+        self._jobs[job.id] = job
+        self._pending.append(job.id)
+        self._inflight[job.dedup_key] = job.id
+        self._store.save_job(job)
+
+    def _join_inflight(self, params: dict) -> Job:
+        # Single-flight: a request identical to an unfinished job subscribes to it
+        job = self._jobs.get(self._inflight.get(dedup_key(params)))
+        if job is None or job.state in FINISHED_STATES or job.cancel_requested_at is not None:
+            return None
+        priority = params.get("priority", "normal")
+        if PRIORITIES.get(priority, 1) < PRIORITIES.get(job.params.get("priority"), 1):
+            job.params["priority"] = priority
+            self._store.save_job(job)
+        print(colored(f"[+] Request joined in-flight job {job.id}", "blue"))
+        return job
+
+    def submit_batch(self, params_list: list) -> tuple:
+        """
+        Queues several jobs at once. Either all of them are queued or, if they do not fit into the queue, none. Videos identical to an in-flight job (or to an earlier video of the batch) join that job.
+
+        Args:
+            params_list (list): The parameters of every job.
+
+        Returns:
+            tuple: The ID of the batch, its distinct jobs and the batch's subscription token for each of them.
+
+        Raises:
+            QueueFull: If the jobs do not fit into the queue.
+        """
+        batch_id = uuid.uuid4().hex
+        with self._lock:
+            new_jobs = {}
+            for params in params_list:
+                key = dedup_key(params)
+                if key not in new_jobs and self._jobs.get(self._inflight.get(key)) is None:
+                    new_jobs[key] = None
+            if len(self._pending) + len(new_jobs) > MAX_QUEUE_DEPTH:
+                raise QueueFull(self._retry_after())
+
+            # A video listed twice is one job of the batch
+            jobs = {}
+            for params in params_list:
+                job = self._join_inflight(params)
+                if job is None:
+                    job = Job(dict(params, batchId=batch_id))
+                    self._enqueue(job)
+                jobs[job.id] = job
+            jobs = list(jobs.values())
+            subscriptions = []
+            for job in jobs:
+                subscriptions.append(job.subscribe())
+                self._store.save_job(job)
+            self._store.save_batch(batch_id, [job.id for job in jobs])
+        return batch_id, jobs, subscriptions
+
+    def get_batch(self, batch_id: str) -> dict:
+        """
+        Builds the aggregated status of a batch.
+
+        Args:
+            batch_id (str): The ID of the batch.
+
+        Returns:
+            dict: The batch's overall 'state' ('queued', 'running', 'succeeded', 'partial', 'failed' or 'cancelled'), the number of jobs per state, the outputs of its successful jobs, its ETA and every job's status, or None if the batch does not exist.
+        """
+        job_ids = self._store.load_batch(batch_id)
+        if job_ids is None:
+            return None
+
+        # Batches saved before duplicates were merged list a job once per video
+        jobs = [self.get(job_id) for job_id in dict.fromkeys(job_ids)]
+        jobs = [job for job in jobs if job is not None]
+        counts = {}
+        for job in jobs:
+            counts[job.state] = counts.get(job.state, 0) + 1
+
+        if any(job.state not in FINISHED_STATES for job in jobs):
+            started = counts.get(RUNNING) or any(job.state in FINISHED_STATES for job in jobs)
+            state = RUNNING if started else QUEUED
+        elif counts.get(SUCCEEDED) == len(jobs):
+            state = SUCCEEDED
+        elif counts.get(SUCCEEDED):
+            state = "partial"
+        elif counts.get(FAILED):
+            state = FAILED
+        else:
+            state = CANCELLED
+
+        etas = [job.eta for job in jobs if job.state not in FINISHED_STATES]
+        return {
+            "batchId": batch_id,
+            "state": state,
+            "counts": counts,
+            "clips": [job.result.get("clips") for job in jobs if job.state == SUCCEEDED and job.result],
+            "eta": max(etas) if etas and None not in etas else None,
+            "jobs": [job.to_dict() for job in jobs],
+        }
+
+    def estimate_seconds(self, job: Job) -> float:
+        """
+        Estimates how much processing a job has left with the cost model fitted on past jobs, from the stages it has already run.
+
+        Args:
+            job (Job): The job.
+
+        Returns:
+            float: The estimated remaining processing time in seconds, or None if the source duration is unknown.
+        """
+        done = dict(job.stage_timings)
+        if job.stage is not None and job.stage_started_at is not None:
+            done[job.stage] = done.get(job.stage, 0.0) + max(0.0, time.time() - job.stage_started_at)
+        return self._cost_model.predict(job.params, job.segments, done)
+
+    def _etas(self) -> dict:
+        now = time.time()
+        etas = {}
+        # Time at which each render slot becomes free
+        slots = []
+        unknown = 0
+        for worker in self._workers:
+            job = self._jobs.get(worker.job_id)
+            if job is None:
+                continue
+            estimate = self.estimate_seconds(job)
+            if estimate is None:
+                # Busy for an unknown time; the other slots still get ETAs
+                unknown += 1
+                continue
+            slots.append(estimate)
+            etas[job.id] = estimate
+        slots += [0.0] * (self.max_concurrent - unknown - len(slots))
+        slots = sorted(slots)[:max(0, self.max_concurrent - unknown)]
+
+        for job in self._scheduled(now):
+            estimate = self.estimate_seconds(job)
+            if estimate is None or not slots:
+                break
+            start = slots.pop(0)
+            etas[job.id] = start + estimate
+            slots = sorted(slots + [etas[job.id]])
+        return etas
+
+    def _scheduled(self, now: float) -> list:
+        # Pending jobs in the order the scheduler would start them
+        jobs = [self._jobs[job_id] for job_id in self._pending]
+        return sorted(jobs, key=lambda job: schedule_key(job, self.estimate_seconds(job), now))
+
+    def _retry_after(self) -> int:
+        # A queue slot frees up as soon as the first running job finishes
+        etas = self._etas()
+        remaining = [etas[worker.job_id] for worker in self._workers if worker.job_id in etas]
+        if not remaining:
+            return 30
+        return max(1, math.ceil(min(remaining)))
+
+    def _update_cost_model(self) -> None:
+        self._cost_model.fit(self._store.recent_runs(limit=200))
+
+    def _resume_jobs(self) -> None:
+        # Requeue the jobs that were queued or running when the backend went down;
+        # their workers skip every stage that has a valid checkpoint
+        with self._lock:
+            for row in self._store.load_jobs((QUEUED, RUNNING)):
+                job = Job.from_row(row)
+                job.state = QUEUED
+                job.started_at = None
+                self._enqueue(job)
+            if self._pending:
+                print(colored(f"[+] Resuming {len(self._pending)} unfinished jobs", "green"))
+
+    def get(self, job_id: str) -> Job:
+        """
+        Looks up a job by its ID and refreshes its predicted ETA.
+
+        Args:
+            job_id (str): The ID of the job.
+
+        Returns:
+            Job: The job, or None if it does not exist.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.eta = self._etas().get(job_id)
+        if job is None:
+            # Finished before the last restart
+            row = self._store.load_job(job_id)
+            job = Job.from_row(row) if row else None
+        return job
+
+    def wait_events(self, job_id: str, after: int, timeout: float = 15) -> tuple:
+        """
+        Waits for events of a job newer than a given event ID. Once the job has finished, its final 'state' event is always included, so a client that has seen every event (or reconnects after a restart) still learns how it ended.
+
+        Args:
+            job_id (str): The ID of the job.
+            after (int): The ID of the last event the caller has seen.
+            timeout (float): The maximum number of seconds to wait for a new event.
+
+        Returns:
+            tuple: The list of new events and whether the job has finished.
+        """
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._changed.wait_for(
+                    lambda: job.last_event_id > after or job.state in FINISHED_STATES,
+                    timeout=timeout,
+                )
+                events = [event for event in job.events if event["id"] > after]
+                finished = job.state in FINISHED_STATES
+        if job is None:
+            # Finished before the last restart
+            row = self._store.load_job(job_id)
+            if row is None:
+                return [], True
+            job = Job.from_row(row)
+            events, finished = [], True
+        if finished and not any(event["type"] == "state" and event["state"] in FINISHED_STATES for event in events):
+            events.append(job.final_event())
+        return events, finished
+
+    def cancel(self, job_id: str, subscription: str = None) -> Job:
+        """
+        Cancels a request for a job. The job itself is only cancelled once no request is waiting for it anymore: queued jobs are dropped right away, running jobs are asked to stop and have their worker killed if they do not within CANCEL_GRACE_SECONDS. Cancelling the same subscription again changes nothing.
+
+        Args:
+            job_id (str): The ID of the job to cancel.
+            subscription (str): The subscription token returned when the job was submitted.
+
+        Returns:
+            Job: The job, or None if it does not exist.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED_STATES:
+                return job
+            job.subscriptions.discard(subscription)
+            if job.subscriptions:
+                # Other requests still wait for this job
+                self._store.save_job(job)
+                return job
+            if job.state == QUEUED and job.worker is None:
+                self._pending.remove(job.id)
+                self._finish(job, CANCELLED)
+            elif job.cancel_requested_at is None:
+                job.cancel_requested_at = time.time()
+                self._workers[job.worker].cancel_event.set()
+            return job
+
+    def _finish(self, job: Job, state: str, payload=None) -> None:
+        if self._inflight.get(job.dedup_key) == job.id:
+            del self._inflight[job.dedup_key]
+        job.state = state
+        job.finished_at = time.time()
+        job.add_event({"type": "state", "state": state, "time": job.finished_at})
+        self._changed.notify_all()
+        if state == SUCCEEDED:
+            job.result = payload
+        elif state == FAILED:
+            job.error = payload
+        if state != SUCCEEDED:
+            remove_job_dir(job.id)
+        self._store.save_job(job)
+        self._store.clear_stages(job.id)
+        if state == SUCCEEDED:
+            self._update_cost_model()
+        print(colored(f"[+] [{job.id}] Job {state}", "green" if state == SUCCEEDED else "red"))
+
+    def _requeue(self, job: Job) -> None:
+        job.state = QUEUED
+        job.worker = None
+        job.stage = None
+        job.started_at = None
+        job.add_event({"type": "state", "state": QUEUED, "time": time.time()})
+        self._changed.notify_all()
+        self._pending.append(job.id)
+        self._store.save_job(job)
+        print(colored(f"[-] [{job.id}] Worker died, requeueing the job (attempt {job.attempts} of {MAX_ATTEMPTS})", "yellow"))
+
+    def _dispatch_loop(self) -> None:
+        while self._running:
+            ready = wait([worker.events for worker in self._workers], timeout=0.2)
+            for worker in self._workers:
+                if worker.events in ready:
+                    for event in worker.receive():
+                        self._handle_event(*event)
+            with self._lock:
+                self._enforce_cancellations()
+                self._reap_workers()
+                self._assign_jobs()
+
+    def _handle_event(self, kind: str, job_id: str, worker_id: int, payload) -> None:
+        with self._lock:
+            self._apply_event(kind, job_id, worker_id, payload)
+
+    def _apply_event(self, kind: str, job_id: str, worker_id: int, payload) -> None:
+        # Called with the lock held
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        if kind == "event":
+            job.add_event(payload)
+            # Saved before anyone can see the event, so its ID is never handed out twice
+            self._store.save_event_id(job.id, job.last_event_id)
+            self._changed.notify_all()
+        elif kind == "started":
+            job.state = RUNNING
+            job.started_at = time.time()
+            job.attempts += 1
+            job.add_event({"type": "state", "state": RUNNING, "time": job.started_at, "attempt": job.attempts})
+            self._store.save_job(job)
+            self._changed.notify_all()
+        elif kind in FINISHED_STATES:
+            if self._workers[worker_id].job_id == job_id:
+                self._workers[worker_id].job_id = None
+            if job.state not in FINISHED_STATES:
+                # A job that returned after a cancel was requested did not deliver what was asked for
+                if kind == SUCCEEDED and job.cancel_requested_at is not None:
+                    kind, payload = CANCELLED, None
+                self._finish(job, kind, payload)
+
+    def _assign_jobs(self) -> None:
+        busy = sum(1 for worker in self._workers if worker.job_id is not None)
+        for worker in self._workers:
+            if not self._pending or busy >= self.max_concurrent:
+                return
+            if worker.job_id is None and worker.process.is_alive():
+                busy += 1
+                job = self._scheduled(time.time())[0]
+                self._pending.remove(job.id)
+                worker.job_id = job.id
+                job.worker = worker.id
+                worker.cancel_event.clear()
+                worker.inbox.put((job.id, job.params))
+
+    def _enforce_cancellations(self) -> None:
+        # Kill workers whose job ignored a cancel for longer than the grace period,
+        # e.g. while stuck inside a whisper transcription
+        now = time.time()
+        for worker in self._workers:
+            job = self._jobs.get(worker.job_id)
+            if job is None or job.cancel_requested_at is None:
+                continue
+            if now - job.cancel_requested_at >= CANCEL_GRACE_SECONDS and worker.process.is_alive():
+                print(colored(f"[-] [{job.id}] Job did not stop in time, killing worker {worker.id}", "yellow"))
+                kill_child_processes(worker.process.pid)
+                worker.process.kill()
+                worker.process.join(timeout=1)
+
+    def _reap_workers(self) -> None:
+        # Replace workers that died (e.g. OOM-killed) and requeue the job they were running;
+        # its scratch directory and checkpoints are kept, so the next attempt resumes where this one stopped
+        for i, worker in enumerate(self._workers):
+            if worker.process.is_alive():
+                continue
+            # Events the worker sent right before it died, e.g. that its job finished
+            for event in worker.receive():
+                self._apply_event(*event)
+            job = self._jobs.get(worker.job_id)
+            if job is not None and job.state not in FINISHED_STATES:
+                if job.cancel_requested_at is not None:
+                    self._finish(job, CANCELLED)
+                elif job.attempts >= MAX_ATTEMPTS:
+                    self._finish(job, FAILED, f"Worker exited with code {worker.process.exitcode} in each of {job.attempts} attempts")
+                else:
+                    self._requeue(job)
+            print(colored(f"[-] Worker {worker.id} exited, restarting it", "yellow"))
+            worker.events.close()
+            self._workers[i] = _Worker(worker.id, self._context)
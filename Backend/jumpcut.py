@@ -0,0 +1,208 @@
+import os
+import subprocess
+import tempfile
+import numpy as np
+
+from termcolor import colored
+from dotenv import load_dotenv
+from imageio_ffmpeg import get_ffmpeg_exe
+from segments import SegmentSet
+
+load_dotenv("../.env")
+
+# x264 preset of the jump cut, slower presets give smaller files at the same quality
+JUMPCUT_PRESET = os.getenv("JUMPCUT_PRESET", "medium")
+
+# x264 quality of the jump cut, lower is better
+JUMPCUT_CRF = 20
+
+# Font of the burned-in captions, the same one the clip captions use
+FONTS_DIR = "../fonts"
+FONT_NAME = "The Bold Font"
+
+# Size and frame rate of the output, the vertical format `combine_videos` renders the clips to
+OUTPUT_WIDTH = 1080
+OUTPUT_HEIGHT = 1920
+OUTPUT_FPS = 30
+
+# Height libass lays out SRT captions at, font sizes are given relative to it
+SUBTITLE_PLAY_HEIGHT = 288
+
+# Colour names the frontend offers, as RRGGBB
+COLOURS = {
+    "black": "000000",
+    "white": "FFFFFF",
+    "yellow": "FFFF00",
+    "red": "FF0000",
+    "green": "00FF00",
+    "blue": "0000FF",
+}
+
+
+def jump_cut_filter(inputs: list, audio: bool = True, subtitles: str = None) -> str:
+    """
+    Builds an ffmpeg filtergraph that keeps the given segments of one or more inputs and joins them. Every input is split once per segment, every branch is trimmed to its segment and all branches are concatenated in order, so audio and video are realigned at every cut and the whole video is decoded and encoded only once. The joined video is centre-cropped to 9:16 and scaled to OUTPUT_WIDTH x OUTPUT_HEIGHT like the combined clips.
+
+    Args:
+        inputs (list): One SegmentSet per ffmpeg input, the segments to keep in seconds of that input.
+        audio (bool): Whether the inputs have an audio stream to cut along.
+        subtitles (str): Optional filter options of captions burned into the joined video, as returned by `subtitle_options`.
+
+    Returns:
+        str: The filtergraph, with the outputs labelled [v] and [a].
+    """
+    graph = []
+    parts = []
+    for index, segments in enumerate(inputs):
+        if not len(segments):
+            continue
+        labels = [f"{index}_{number}" for number in range(len(segments))]
+        graph.append(f"[{index}:v]split={len(segments)}" + "".join(f"[sv{label}]" for label in labels))
+        if audio:
+            graph.append(f"[{index}:a]asplit={len(segments)}" + "".join(f"[sa{label}]" for label in labels))
+        for label, (start, end) in zip(labels, segments):
+            graph.append(f"[sv{label}]trim=start={start:.6f}:end={end:.6f},setpts=PTS-STARTPTS[v{label}]")
+            parts.append(f"[v{label}]")
+            if audio:
+                graph.append(f"[sa{label}]atrim=start={start:.6f}:end={end:.6f},asetpts=PTS-STARTPTS[a{label}]")
+                parts.append(f"[a{label}]")
+
+    if not parts:
+        raise ValueError("There is no segment to keep.")
+    segments = len(parts) // (2 if audio else 1)
+    graph.append("".join(parts) + f"concat=n={segments}:v=1:a={int(audio)}[joined]" + ("[a]" if audio else ""))
+    # The widest (or tallest) centred 9:16 part of the frame, as `combine_videos` crops
+    vertical = [
+        f"crop='min(iw,ih*{OUTPUT_WIDTH}/{OUTPUT_HEIGHT})':'min(ih,iw*{OUTPUT_HEIGHT}/{OUTPUT_WIDTH})'",
+        f"scale={OUTPUT_WIDTH}:{OUTPUT_HEIGHT}",
+        "setsar=1",
+        f"fps={OUTPUT_FPS}",
+    ]
+    if subtitles:
+        vertical.append(f"subtitles={subtitles}")
+    graph.append("[joined]" + ",".join(vertical) + "[v]")
+    return ";\n".join(graph)
+
+
+def jump_cut_lines(lines: list, segments: SegmentSet) -> list:
+    """
+    Moves timed sentences from the time of the source to the time of its jump cut. Times within a cut are moved to the end of the segment before it, so a sentence spanning a cut stays one caption.
+
+    Args:
+        lines (list): The 'start' and 'end' (in seconds of the source) and the 'text' of every sentence.
+        segments (SegmentSet): The kept segments, sorted and without overlaps.
+
+    Returns:
+        list: The sentences that are at least partly kept, in seconds of the jump cut.
+    """
+    if not lines or not len(segments):
+        return []
+    offsets = np.concatenate([[0], np.cumsum(segments.durations)[:-1]])
+
+    def to_output(times):
+        index = np.searchsorted(segments.starts, times, side="right") - 1
+        inside = np.clip(times - segments.starts[np.maximum(index, 0)], 0, segments.durations[np.maximum(index, 0)])
+        return np.where(index >= 0, offsets[np.maximum(index, 0)] + inside, 0.0)
+
+    starts = to_output(np.array([line["start"] for line in lines], dtype=np.float64))
+    ends = to_output(np.array([line["end"] for line in lines], dtype=np.float64))
+    return [
+        dict(line, start=float(start), end=float(end))
+        for line, start, end in zip(lines, starts, ends)
+        if end > start
+    ]
+
+
+def subtitle_options(subtitles_path: str, font_size: int = None, font_colour: str = None, stroke_colour: str = None, video_height: int = None) -> str:
+    """
+    Builds the options of ffmpeg's subtitles filter for captions styled like the ones of the rendered clips: centred, in the caption font and with a thick outline.
+
+    Args:
+        subtitles_path (str): The path to the SRT file.
+        font_size (int): The font size in pixels of the video.
+        font_colour (str): The colour of the text, '#RRGGBB' or a colour name.
+        stroke_colour (str): The colour of the outline.
+        video_height (int): The height of the source video; the captions keep their size relative to it when the video is scaled to OUTPUT_HEIGHT. 1080 if unknown.
+
+    Returns:
+        str: The filter options.
+    """
+    scale = SUBTITLE_PLAY_HEIGHT / (video_height or 1080)
+    # Alignment 10 centres the captions vertically and horizontally (libass reads forced alignments the SSA way)
+    style = [f"FontName={FONT_NAME}", "Alignment=10", "BorderStyle=1", f"Outline={2.5 * scale:.2f}", "Shadow=0"]
+    if font_size:
+        style.append(f"Fontsize={float(font_size) * scale:.1f}")
+    for key, colour in (("PrimaryColour", font_colour), ("OutlineColour", stroke_colour)):
+        colour = _ass_colour(colour)
+        if colour:
+            style.append(f"{key}={colour}")
+    return f"filename={_quote(subtitles_path)}:fontsdir={_quote(FONTS_DIR)}:force_style={_quote(','.join(style))}"
+
+
+def render_jump_cut(inputs: list, output_path: str, audio: bool = True, subtitles: str = None, on_progress=None) -> str:
+    """
+    Renders the jump cut of one or more videos with a single ffmpeg run, see `jump_cut_filter`.
+
+    Args:
+        inputs (list): (video path, SegmentSet) pairs, the segments to keep in seconds of every video.
+        output_path (str): The path of the rendered video.
+        audio (bool): Whether the videos have audio.
+        subtitles (str): Optional filter options of captions to burn in, as returned by `subtitle_options`.
+        on_progress (Callable): Optional callback receiving the rendered and the total seconds of the jump cut; exceptions it raises stop the render.
+
+    Returns:
+        str: The path of the rendered video.
+
+    Raises:
+        ValueError: If no segment is kept.
+        RuntimeError: If ffmpeg fails.
+    """
+    total = sum(float(segments.durations.sum()) for _, segments in inputs)
+    print(colored(f"[+] Rendering a {total:.0f} second jump cut of {sum(len(segments) for _, segments in inputs)} segments", "blue"))
+
+    # Graphs of long videos get too long for a command line
+    script = tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False)
+    with script:
+        script.write(jump_cut_filter([segments for _, segments in inputs], audio, subtitles))
+    command = [get_ffmpeg_exe(), "-nostdin", "-y", "-loglevel", "error", "-progress", "pipe:1"]
+    for video_path, _ in inputs:
+        command += ["-i", video_path]
+    command += ["-filter_complex_script", script.name, "-map", "[v]"]
+    if audio:
+        command += ["-map", "[a]", "-c:a", "aac", "-b:a", "192k"]
+    command += ["-c:v", "libx264", "-preset", JUMPCUT_PRESET, "-crf", str(JUMPCUT_CRF), "-pix_fmt", "yuv420p", "-movflags", "+faststart", output_path]
+
+    # A file instead of a pipe, so a stream of warnings can never block ffmpeg
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=log, text=True)
+    try:
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            if key == "out_time_us" and value.isdigit() and on_progress is not None:
+                on_progress(min(int(value) / 1e6, total), total)
+        if process.wait() != 0:
+            log.seek(0)
+            raise RuntimeError(f"ffmpeg could not render the jump cut: {log.read().decode(errors='replace').strip()}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        log.close()
+        os.remove(script.name)
+    return output_path
+
+
+def _ass_colour(colour: str) -> str:
+    # ASS colours are &HBBGGRR
+    if not colour:
+        return None
+    rgb = COLOURS.get(colour.lower(), colour.lstrip("#"))
+    if len(rgb) != 6 or any(digit not in "0123456789abcdefABCDEF" for digit in rgb):
+        return None
+    return f"&H00{rgb[4:6]}{rgb[2:4]}{rgb[0:2]}".upper()
+
+
+def _quote(value: str) -> str:
+    # Quotes a filter option value; inside quotes only the quote itself needs escaping
+    return "'" + value.replace("'", "'\\''") + "'"
@@ -0,0 +1,339 @@
+import os
+import time
+import threading
+import subprocess
+import http.server
+import numpy as np
+import yt_dlp
+
+from functools import partial
+from termcolor import colored
+from dotenv import load_dotenv
+from imageio_ffmpeg import get_ffmpeg_exe
+from audio import ANALYSIS_SAMPLE_RATE, pcm_blocks
+
+load_dotenv("../.env")
+
+# Length (in seconds) of the segments a live stream is recorded in
+LIVE_SEGMENT_SECONDS = float(os.getenv("LIVE_SEGMENT_SECONDS", "10"))
+
+# Seconds of silence that close a clip of a live stream
+LIVE_MIN_SILENCE_SECONDS = float(os.getenv("LIVE_MIN_SILENCE_SECONDS", "0.5"))
+
+# Longest clip (in seconds) cut from a live stream; longer speech is split
+LIVE_MAX_CLIP_SECONDS = float(os.getenv("LIVE_MAX_CLIP_SECONDS", "60"))
+
+# Level (in dBFS) audio must reach to count as speech, so a quiet lead-in is not taken for speech before anything louder has been heard
+LIVE_MIN_SPEECH_DBFS = float(os.getenv("LIVE_MIN_SPEECH_DBFS", "-50"))
+
+# Speech shorter than this (in seconds) is not worth a clip
+MIN_CLIP_SECONDS = 1.0
+
+# Seconds between two checks for newly recorded segments
+POLL_INTERVAL = 0.5
+
+
+class SpeechSegmenter:
+    """
+    Splits a stream of PCM audio into speech segments as it arrives. Blocks quieter than `top_db` below the loudest block heard so far count as silence (the same rule as `librosa.effects.split`, but with a running instead of a global reference). Until the reference is `top_db` above `min_level`, blocks below `min_level` count as silence, so the noise before the first speech is not measured against itself. A segment closes once the silence after it lasts `min_silence` seconds. Only the state of the open segment is kept, so memory does not grow with the stream.
+    """
+
+    def __init__(self, sample_rate: int = ANALYSIS_SAMPLE_RATE, top_db: float = 30, min_silence: float = LIVE_MIN_SILENCE_SECONDS, max_speech: float = LIVE_MAX_CLIP_SECONDS, min_speech: float = MIN_CLIP_SECONDS, min_level: float = LIVE_MIN_SPEECH_DBFS, block: int = 512) -> None:
+        self.sample_rate = sample_rate
+        self.top_db = top_db
+        self.min_silence = min_silence
+        self.max_speech = max_speech
+        self.min_speech = min_speech
+        self.min_level = min_level
+        self.block = block
+        self.reference = -np.inf
+        self.position = 0
+        self.speech_start = None
+        self.last_voice = None
+        self._rest = np.zeros(0, dtype=np.float32)
+
+    @property
+    def time(self) -> float:
+        """
+        float: Stream time (in seconds) up to which audio has been analysed.
+        """
+        return self.position / self.sample_rate
+
+    @property
+    def open_since(self) -> float:
+        """
+        float: Start of the speech segment that has not closed yet, or None.
+        """
+        return self.speech_start
+
+    def feed(self, samples: np.ndarray) -> list:
+        """
+        Analyses the next chunk of audio.
+
+        Args:
+            samples (np.ndarray): The mono float32 samples following the previous chunk.
+
+        Returns:
+            list: The (start, end) times in seconds of the speech segments that closed in this chunk.
+        """
+        samples = np.concatenate([self._rest, samples])
+        count = len(samples) // self.block
+        self._rest = samples[count * self.block:]
+        if not count:
+            return []
+
+        blocks = samples[:count * self.block].reshape(count, self.block)
+        levels = 20 * np.log10(np.maximum(np.sqrt(np.mean(blocks ** 2, axis=1)), 1e-10))
+        closed = []
+        for level in levels:
+            self.reference = max(self.reference, level)
+            start = self.position / self.sample_rate
+            self.position += self.block
+            end = self.position / self.sample_rate
+            if level >= max(self.reference - self.top_db, self.min_level):
+                if self.speech_start is None:
+                    self.speech_start = start
+                self.last_voice = end
+                if self.last_voice - self.speech_start >= self.max_speech:
+                    closed += self._close()
+            elif self.speech_start is not None and end - self.last_voice >= self.min_silence:
+                closed += self._close()
+        return closed
+
+    def flush(self) -> list:
+        """
+        Closes the open speech segment at the end of the stream.
+
+        Returns:
+            list: The (start, end) times of the last speech segment, if any.
+        """
+        return self._close() if self.speech_start is not None else []
+
+    def _close(self) -> list:
+        segment = (self.speech_start, self.last_voice)
+        self.speech_start = None
+        return [segment] if segment[1] - segment[0] >= self.min_speech else []
+
+
+class LiveRecorder:
+    """
+    Records a live stream (or streams a video that is still downloading) with ffmpeg into numbered segments of about LIVE_SEGMENT_SECONDS each and reports every segment once it is complete. Complete segments can be decoded on their own, so everything up to `decodable_until` is safe to process while the rest is still arriving.
+    """
+
+    def __init__(self, stream_urls: list, directory: str, max_seconds: float = None) -> None:
+        """
+        Args:
+            stream_urls (list): The URL of the HLS/DASH manifest or media to record, or the URLs of its separate video and audio streams.
+            directory (str): The directory the segments are written to.
+            max_seconds (float): Optional limit of the recording.
+        """
+        self.directory = directory
+        self.list_path = os.path.join(directory, "segments.csv")
+        self.decodable_until = 0.0
+        command = [get_ffmpeg_exe(), "-nostdin", "-y", "-loglevel", "error"]
+        for url in stream_urls:
+            command += ["-i", url]
+        if max_seconds:
+            command += ["-t", str(max_seconds)]
+        command += [
+            "-map", "0:v:0", "-map", f"{len(stream_urls) - 1}:a:0", "-c", "copy",
+            # Matroska segments carry their own headers, so each can be decoded on its own
+            "-f", "segment", "-segment_format", "matroska", "-segment_time", str(LIVE_SEGMENT_SECONDS), "-reset_timestamps", "1",
+            "-segment_list", self.list_path, "-segment_list_type", "csv", "-segment_list_flags", "+live",
+            os.path.join(directory, "segment_%06d.mkv"),
+        ]
+        # A file instead of a pipe, so a chatty ffmpeg can never block on a full pipe
+        self._log = open(os.path.join(directory, "ffmpeg.log"), "w+")
+        self.process = subprocess.Popen(command, stderr=self._log)
+        self._seen = 0
+
+    def segments(self, token=None):
+        """
+        Yields the segments of the recording as they complete, until the stream ends.
+
+        Args:
+            token (CancelToken): Optional cancellation token, checked while waiting for segments.
+
+        Yields:
+            tuple: The path, start and end (in seconds of stream time) of a segment.
+
+        Raises:
+            RuntimeError: If ffmpeg fails before recording anything.
+        """
+        while True:
+            running = self.process.poll() is None
+            for segment in self._new_segments():
+                yield segment
+            # A cancelled job's recorder is killed, which must not pass for the end of the stream
+            if token is not None:
+                token.raise_if_cancelled()
+            if not running:
+                break
+            time.sleep(POLL_INTERVAL)
+
+        if self.process.returncode != 0 and not self._seen:
+            self._log.seek(0)
+            raise RuntimeError(f"ffmpeg could not record the stream: {self._log.read().strip()}")
+
+    def stop(self) -> None:
+        """
+        Stops the recording.
+
+        Returns:
+            None
+        """
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self._log.close()
+
+    def _new_segments(self) -> list:
+        if not os.path.isfile(self.list_path):
+            return []
+        with open(self.list_path) as file:
+            # The last line may still be being written
+            lines = [line.strip() for line in file if line.endswith("\n")]
+        segments = []
+        for line in lines[self._seen:]:
+            name, start, end = line.rsplit(",", 2)
+            segments.append((os.path.join(self.directory, name), float(start), float(end)))
+            self.decodable_until = float(end)
+        self._seen = len(lines)
+        return segments
+
+
+class RollingWindow:
+    """
+    The recorded segments and their decoded audio that may still be needed for a clip. Segments ending before the oldest time still needed are deleted, so disk and memory stay bounded by the longest clip.
+    """
+
+    def __init__(self) -> None:
+        self.segments = []
+
+    def add(self, path: str, start: float, end: float) -> np.ndarray:
+        """
+        Adds a completed segment and decodes its audio.
+
+        Args:
+            path (str): The path to the segment.
+            start (float): The stream time the segment starts at.
+            end (float): The stream time the segment ends at.
+
+        Returns:
+            np.ndarray: The analysis samples of the segment.
+        """
+        samples = np.concatenate(list(pcm_blocks(path)))
+        self.segments.append({"path": path, "start": start, "end": end, "samples": samples})
+        return samples
+
+    def cut(self, start: float, end: float, output_path: str) -> tuple:
+        """
+        Joins the segments covering a time range into one file.
+
+        Args:
+            start (float): The start of the range in stream time.
+            end (float): The end of the range in stream time.
+            output_path (str): The path of the joined file.
+
+        Returns:
+            tuple: The joined file, the stream time it starts at and its analysis samples.
+        """
+        covering = [s for s in self.segments if s["end"] > start and s["start"] < end]
+        list_path = f"{os.path.splitext(output_path)[0]}.txt"
+        with open(list_path, "w") as file:
+            file.writelines(f"file '{os.path.abspath(s['path'])}'\n" for s in covering)
+        command = [
+            get_ffmpeg_exe(), "-nostdin", "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", output_path,
+        ]
+        result = subprocess.run(command, capture_output=True, text=True)
+        os.remove(list_path)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg could not join the segments: {result.stderr.strip()}")
+        return output_path, covering[0]["start"], np.concatenate([s["samples"] for s in covering])
+
+    def release(self, before: float) -> None:
+        """
+        Deletes the segments that end before a time.
+
+        Args:
+            before (float): The oldest stream time that is still needed.
+
+        Returns:
+            None
+        """
+        while self.segments and self.segments[0]["end"] <= before:
+            os.remove(self.segments.pop(0)["path"])
+
+
+def resolve_stream_urls(video_url: str, video_format="best") -> list:
+    """
+    Looks up the media URLs of a video or live stream with yt_dlp.
+
+    Args:
+        video_url (str): The page or manifest URL of the video.
+        video_format: The yt_dlp format (selector) to resolve.
+
+    Returns:
+        list: The URL ffmpeg reads from, or the URLs of the separate video and audio streams.
+    """
+    with yt_dlp.YoutubeDL({'quiet': True, 'noplaylist': True, 'format': video_format}) as ydl:
+        info = ydl.extract_info(video_url, download=False)
+    return [f['url'] for f in info.get('requested_formats') or [info]]
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+
+def simulate_live_hls(media_path: str, directory: str, port: int = 8765, segment_seconds: float = 4) -> tuple:
+    """
+    Serves a local video as a live HLS stream for testing the live mode offline. ffmpeg publishes the video in real time into a sliding playlist that ends once the video is over.
+
+    Args:
+        media_path (str): The path to the video to stream.
+        directory (str): The directory the playlist and its segments are written to.
+        port (int): The local port the playlist is served on.
+        segment_seconds (float): The length of the HLS segments.
+
+    Returns:
+        tuple: The URL of the playlist and a function that stops the simulation.
+    """
+    os.makedirs(directory, exist_ok=True)
+    publisher = subprocess.Popen([
+        get_ffmpeg_exe(), "-nostdin", "-y", "-loglevel", "error", "-re", "-i", media_path,
+        "-c", "copy", "-f", "hls", "-hls_time", str(segment_seconds), "-hls_list_size", "6",
+        "-hls_flags", "delete_segments", os.path.join(directory, "live.m3u8"),
+    ])
+    handler = partial(_QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # Players need the first segment before they can start
+    while publisher.poll() is None and not os.path.exists(os.path.join(directory, "live.m3u8")):
+        time.sleep(0.1)
+
+    def stop():
+        publisher.terminate()
+        server.shutdown()
+
+    return f"http://127.0.0.1:{port}/live.m3u8", stop
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("Usage: python live.py <video> <directory>")
+        sys.exit(1)
+    url, stop = simulate_live_hls(sys.argv[1], sys.argv[2])
+    print(colored(f"[+] Serving {sys.argv[1]} as a live stream at {url}", "green"))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop()
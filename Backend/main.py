@@ -1,12 +1,13 @@
-import time
-from flask import Flask, request, jsonify
+import re
+import json
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-import yt_dlp
-from moviepy.editor import VideoFileClip
-import librosa
-from whisperTS.main import create_sentences_from_audio
-from video import *
-from utils import *
+from termcolor import colored
+from jobs import JobManager, QueueFull
+from ingest import SourceTooLong, probe_source, parse_ranges, check_source_duration
+from scheduler import PRIORITIES
+from uploads import UploadStore, UploadError, UPLOAD_EXTRACTOR
 
 # Initialize Flask
 app = Flask(__name__)
@@ -15,236 +16,334 @@ CORS(app)
 # Constants
 HOST = "0.0.0.0"
 PORT = 8080
-GENERATING = False
-LOCALVIDDIR = "../temp/"
-COUNT = 0
+
+# Background job queue and render workers
+JOBS = JobManager()
+
+# Resumable uploads of local source files
+UPLOADS = UploadStore()
+
 
 @app.route("/api/generate", methods=["POST"])
 def generate():
     """
-    Handles the POST request to the `/api/generate` endpoint. It processes the provided YouTube video URL by downloading the video, detecting and trimming silent segments, and optionally adding subtitles based on the audio content.
+    Handles the POST request to the `/api/generate` endpoint. Queues a job that downloads the provided video, detects and trims silent segments, and adds subtitles based on the audio content. The request returns as soon as the job is queued; the request parameters are listed in the README.
+
+    Args:
+        None directly; utilizes the JSON payload from the POST request containing keys: 'aiModel', 'videoUrl' (or 'uploadId'), 'strokeColor', 'fontOutline', 'fontSize' and optional job options.
+
+    Returns:
+        flask.Response: A JSON response indicating the status ('queued' or 'error') and, when queued, the ID of the job to poll at `/api/jobs/<id>` and the subscription token to cancel it with.
+    """
+    # Parse JSON
+    data = request.get_json(silent=True) or {}
+    video_url = data.get('videoUrl') # URL of Video -> Download Video to temp
+    if not video_url and data.get('uploadId'):
+        video_url = f"upload:{data['uploadId']}"
+    if not video_url:
+        return jsonify({"status": "error", "message": "A videoUrl or uploadId is required."}), 400
+    if data.get('priority', 'normal') not in PRIORITIES:
+        return jsonify({"status": "error", "message": f"priority must be one of {', '.join(PRIORITIES)}."}), 400
+
+    # Probe the video (metadata only) so oversized sources never reach a worker
+    source, ranges, error = _probe(video_url, data)
+    if error:
+        message, status = error
+        return jsonify({"status": "error", "message": message}), status
+
+    try:
+        job, subscription, deduplicated = JOBS.submit(_job_params(data, video_url, source, ranges))
+    except QueueFull as e:
+        return _queue_full(e)
+    if deduplicated:
+        print(colored(f"[+] {video_url} is already being processed by job {job.id}", "blue"))
+    else:
+        print(colored(f"[+] Queued job {job.id} for {video_url}", "blue"))
+
+    return jsonify({
+        "status": "queued",
+        "message": "Video queued for processing.",
+        "jobId": job.id,
+        "subscription": subscription,
+        "deduplicated": deduplicated,
+        "estimatedSeconds": JOBS.estimate_seconds(job),
+    }), 202
+
+
+@app.route("/api/generate/batch", methods=["POST"])
+def generate_batch():
+    """
+    Handles the POST request to the `/api/generate/batch` endpoint. Queues one job per video, all sharing the same style options; the jobs run concurrently on the worker pool, which keeps its models loaded between jobs.
+
+    Args:
+        None directly; utilizes the JSON payload from the POST request containing the key 'videoUrls' (a list of URLs, 'upload:<uploadId>' for uploaded files) and the same optional keys as `/api/generate`, applied to every video.
+
+    Returns:
+        flask.Response: A JSON response indicating the status ('queued' or 'error') and, when queued, the ID of the batch to poll at `/api/batches/<id>`, the IDs of its distinct jobs and a subscription token for each of them.
+    """
+    data = request.get_json(silent=True) or {}
+    video_urls = data.get('videoUrls')
+    if not isinstance(video_urls, list) or not video_urls or not all(isinstance(url, str) and url for url in video_urls):
+        return jsonify({"status": "error", "message": "videoUrls must be a non-empty list of URLs."}), 400
+    if data.get('priority', 'normal') not in PRIORITIES:
+        return jsonify({"status": "error", "message": f"priority must be one of {', '.join(PRIORITIES)}."}), 400
+
+    # Probe every video in parallel, the whole batch is rejected if one of them is unusable
+    with ThreadPoolExecutor(max_workers=min(len(video_urls), 8)) as executor:
+        probes = list(executor.map(lambda video_url: _probe(video_url, data), video_urls))
+    for video_url, (source, ranges, error) in zip(video_urls, probes):
+        if error:
+            message, status = error
+            return jsonify({"status": "error", "message": message, "videoUrl": video_url}), status
+
+    try:
+        batch_id, jobs, subscriptions = JOBS.submit_batch([
+            _job_params(data, video_url, source, ranges)
+            for video_url, (source, ranges, _) in zip(video_urls, probes)
+        ])
+    except QueueFull as e:
+        return _queue_full(e)
+    print(colored(f"[+] Queued batch {batch_id} with {len(jobs)} jobs", "blue"))
+
+    return jsonify({
+        "status": "queued",
+        "message": f"{len(jobs)} videos queued for processing.",
+        "batchId": batch_id,
+        "jobIds": [job.id for job in jobs],
+        "subscriptions": subscriptions,
+    }), 202
+
+
+@app.route("/api/batches/<batch_id>", methods=["GET"])
+def batch_status(batch_id):
+    """
+    Handles the GET request to the `/api/batches/<id>` endpoint and reports the aggregated state of a batch.
 
     Args:
-        None directly; utilizes global variables and JSON payload from the POST request containing keys: 'aiModel', 'videoUrl', 'strokeColor', 'fontOutline', 'fontSize'.
+        batch_id (str): The ID returned by `/api/generate/batch`.
 
     Returns:
-        flask.Response: A JSON response indicating the status ('success' or 'error') and a message, which in the case of success includes the path to the processed video.
+        flask.Response: A JSON response with the overall state of the batch, the number of jobs per state, the processed videos under 'clips' and the status of every job.
     """
+    batch = JOBS.get_batch(batch_id)
+    if batch is None:
+        return jsonify({"status": "error", "message": "Batch not found."}), 404
+
+    batch["status"] = batch["state"]
+    return jsonify(batch)
+
+
+def _probe(video_url: str, data: dict) -> tuple:
+    # Returns the probed source and requested ranges, or an error message and HTTP status if the video is unusable
     try:
-          # Set global variable
-        global GENERATING
-        GENERATING = True
-        COUNT+1
-        
-        # Clean
-        clean_dir(LOCALVIDDIR)
-        clean_dir("../subtitles/")
- 
-        # Parse JSON
-        data = request.get_json()
-        ai_model = data.get('aiModel')  # Get the AI model selected by the user
-        video_url = data.get('videoUrl') # URL of Video -> Download Video to temp
-        strokeColor = data.get('strokeColor') # URL of Video -> Download Video to temp
-        fontOutline = data.get('fontOutline') # URL of Video -> Download Video to temp
-        fontSize = data.get('fontSize') # URL of Video -> Download Video to temp
-        print(colored(f"[+] Downloading with YTDLP", "blue"))
-
-        video_clips = []
-        if video_url:
-            # Process the provided YouTube video
-            ydl_opts = {
-                'format': 'best',
-                'outtmpl': '../temp/%(id)s.%(ext)s',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-                'keepvideo': True,  # Keep the video file after extracting audio
-         }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(video_url, download=True)
-            video_id = info.get('id', None)
-            audio_path = f"../temp/{video_id}.mp3"
-            video_path = f"../temp/{video_id}.mp4"
-            
-        try:
-            print(colored(f"[+] Downloaded with YTDLP and {data}", "green"))
-            print(colored(f"[+] Identifying Silences from Video", "blue"))
-            silent_segments = detect_silent_segments(audio_path)
-
-        except PermissionError as e:
-            print(f"Permission error when accessing {audio_path}. Retrying...")
-            time.sleep(20)  # Wait a bit for the file to be released
-            silent_segments = detect_silent_segments(audio_path)
-        
-        try:
-            print(colored(f"[+] Creating Clips from video", "blue"))
-            video_clips = trim_silences_from_video(video_path, silent_segments, strokeColor, fontOutline, fontSize)
-            combined_video_path = combine_videos(video_clips, 500, 160)
-      
-        except PermissionError:
-            print(colored(f"Error when rendering {video_clips}...", "red"))
-            return jsonify({"status": "error", "message": str(e)})
-        
-        return jsonify({"status": "success", "message": "Video processed successfully.", "clips": combined_video_path})
+        source = UPLOADS.source(video_url.removeprefix("upload:")) if video_url.startswith("upload:") else probe_source(video_url)
+    except UploadError as e:
+        return None, None, (str(e), e.status)
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)})
+        return None, None, (f"Could not read the video: {e}", 400)
+    if data.get('jumpCut') and source.get("live"):
+        return None, None, ("Jump cuts need the whole video, they cannot be made of live streams.", 400)
+    try:
+        ranges = parse_ranges(data, source)
+        check_source_duration(source, ranges)
+        return source, ranges, None
+    except ValueError as e:
+        return None, None, (str(e), 400)
+    except SourceTooLong as e:
+        return None, None, (str(e), 413)
+
+
+def _job_params(data: dict, video_url: str, source: dict, ranges: list = None) -> dict:
+    return {
+        "aiModel": data.get('aiModel'), # Get the AI model selected by the user
+        "videoUrl": video_url,
+        "strokeColor": data.get('strokeColor'),
+        "fontOutline": data.get('fontOutline'),
+        "fontSize": data.get('fontSize'),
+        "captions": bool(data.get('captions', True)),
+        "jumpCut": bool(data.get('jumpCut', False)),
+        "priority": data.get('priority', 'normal'),
+        "ranges": ranges,
+        "live": bool(source.get("live")),
+        # Uploaded files are complete already
+        "progressive": bool(data.get('progressive', False)) and source.get("extractor") != UPLOAD_EXTRACTOR,
+        "source": source,
+    }
+
+
+def _queue_full(e: QueueFull):
+    response = jsonify({"status": "error", "message": str(e), "retryAfter": e.retry_after})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, 429
 
 
-def detect_silent_segments(audio_path):
+@app.route("/api/uploads", methods=["POST"])
+def create_upload():
     """
-    Detects silent segments within an audio file by analyzing its volume levels.
-    
+    Handles the POST request to the `/api/uploads` endpoint and starts a resumable upload of a local source file. The file is then sent in one or more PUT requests to `/api/uploads/<id>` and processed by passing the upload's ID as 'uploadId' to `/api/generate`.
+
+    Args:
+        None directly; utilizes the JSON payload from the POST request containing the keys 'filename', 'size' (bytes) and optionally 'sha256', which the finished file is checked against.
+
+    Returns:
+        flask.Response: A JSON response with the 'uploadId', the 'offset' to send the first chunk from.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = UPLOADS.create(data.get('filename') or "upload", data.get('size'), data.get('sha256'))
+    except UploadError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.status
+    print(colored(f"[+] Started upload {upload['uploadId']} of {upload['filename']}", "blue"))
+    return jsonify(dict(upload, status="created")), 201
+
+
+@app.route("/api/uploads/<upload_id>", methods=["GET"])
+def upload_status(upload_id):
+    """
+    Handles the GET (or HEAD) request to the `/api/uploads/<id>` endpoint and reports how far an upload has got, e.g. to resume it after a dropped connection.
+
     Args:
-        audio_path (str): Path to the audio file to analyze for silent segments.
-    
+        upload_id (str): The ID returned by `/api/uploads`.
+
     Returns:
-        List[Tuple[float, float]]: A list of tuples, each representing the start and end times (in seconds) of silent segments within the audio file.
+        flask.Response: A JSON response with the status of the upload; the received bytes are also sent in the 'Upload-Offset' header.
     """
-    y, sr = librosa.load(audio_path, sr=None)
-    non_silent_segments = librosa.effects.split(y, top_db=30)
-    silent_segments = invert_segments(non_silent_segments, len(y), sr)
-    return silent_segments
+    try:
+        upload = UPLOADS.status(upload_id)
+    except UploadError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.status
+    response = jsonify(dict(upload, status="complete" if upload["complete"] else "uploading"))
+    response.headers["Upload-Offset"] = str(upload["offset"])
+    response.headers["Upload-Length"] = str(upload["size"])
+    return response
 
 
-def invert_segments(segments, y_length, sr):
+@app.route("/api/uploads/<upload_id>", methods=["PUT"])
+def upload_chunk(upload_id):
     """
-    Inverts non-silent segments to identify silent segments in an audio track. This is useful for finding periods of silence between detected sounds.
-    
+    Handles the PUT request to the `/api/uploads/<id>` endpoint. The body is a chunk of the file and is streamed to disk as it arrives; a 'Content-Range: bytes <first>-<last>/<size>' header places it in the file, without one the body is the whole file. Chunks have to continue where the upload stands; a mismatch is answered with HTTP 409 and the offset to resume from.
+
     Args:
-        segments (List[Tuple[int, int]]): A list of tuples representing the non-silent segments in the audio file.
-        y_length (int): The total number of frames in the audio file.
-        sr (int): The sampling rate of the audio file.
-    
+        upload_id (str): The ID returned by `/api/uploads`.
+
     Returns:
-        List[Tuple[float, float]]: A list of tuples, each indicating the start and end times (in seconds) of silent segments.
+        flask.Response: A JSON response with the status of the upload, 'complete' once the whole file has arrived.
     """
+    length = request.content_length
+    if length is None:
+        return jsonify({"status": "error", "message": "A Content-Length is required."}), 411
+    content_range = request.headers.get("Content-Range")
+    if content_range:
+        match = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+)", content_range.strip())
+        if match is None or int(match[2]) - int(match[1]) + 1 != length:
+            return jsonify({"status": "error", "message": "Content-Range must be 'bytes <first>-<last>/<size>' and match the body."}), 400
+        start, total = int(match[1]), int(match[3])
+    else:
+        start, total = 0, length
 
-    silent_segments = []
-    start = 0
-    for seg in segments:
-        silent_start = librosa.frames_to_time(start, sr=sr)
-        silent_end = librosa.frames_to_time(seg[0], sr=sr)
-        silent_segments.append((silent_start, silent_end))
-        start = seg[1]
-    if start < y_length:
-        silent_end = librosa.frames_to_time(y_length, sr=sr)
-        silent_segments.append((librosa.frames_to_time(start, sr=sr), silent_end))
-    return silent_segments
+    try:
+        upload = UPLOADS.write(upload_id, start, total, request.stream, length)
+    except UploadError as e:
+        response = jsonify({"status": "error", "message": str(e), "offset": e.offset})
+        if e.offset is not None:
+            response.headers["Upload-Offset"] = str(e.offset)
+        return response, e.status
+    if upload["complete"]:
+        print(colored(f"[+] Upload {upload_id} is complete ({upload['sha256']})", "green"))
+    response = jsonify(dict(upload, status="complete" if upload["complete"] else "uploading"))
+    response.headers["Upload-Offset"] = str(upload["offset"])
+    return response
 
 
-def createClip(video_path, start, end, name, strokeColor, fontOutline, fontSize):
-    print(colored(f"[+] Creating Clip using AI", "blue"))
+@app.route("/api/cancel", methods=["POST"])
+def cancel():
     """
-    Creates a video clip from the specified time segment, applies subtitles, and saves the clip to a file.
+    Handles the POST request to the `/api/cancel` endpoint. Withdraws a request for a job; once no request waits for it anymore, a queued job is dropped and the ffmpeg and transcription work of a running job is killed so its worker is free again.
 
     Args:
-        video_path (str): Path to the source video file.
-        start (float): The start time of the clip in the video (in seconds).
-        end (float): The end time of the clip in the video (in seconds).
-        name (str): A unique identifier for the output file.
-        strokeColor (str): Color for the stroke of the subtitle text.
-        fontOutline (str): Color for the font outline.
-        fontSize (int): Font size for the subtitles.
+        None directly; utilizes the JSON payload from the POST request containing the keys 'jobId' and 'subscription' (as returned by `/api/generate`).
 
     Returns:
-        str: The path to the output video file with the applied subtitles.
-    """
-
-    try: 
-        # Define Stuff
-        clip_path = f"{LOCALVIDDIR}{name}.mp4"
-        captioned_clip_path = f"{LOCALVIDDIR}captioned_{name}.mp4"
-        audio_path = f"{LOCALVIDDIR}{name}.mp3"
-        audio_clip = []
-        # Save Clip
-        video = VideoFileClip(video_path)
-        video.subclip(start, end).write_videofile(clip_path, fps=30, codec="libx264")
-        video.subclip(start, end).audio.write_audiofile(audio_path)
-        # Generate Pieces
-        audio_clip.append(video.subclip(start, end).audio)
-        stt = (create_sentences_from_audio(audio_path)).split(". ")
-        stt = list(filter(lambda x: x != "", stt))
-        print(colored(f"[+] Creating subtitles with\n {audio_path}\n {stt}\n {audio_clip}\n", "blue"))
-        subtitles_path = generate_subtitles(
-            audio_path=audio_path, 
-            sentences=stt,
-            audio_clips=audio_clip,
-            )
-        print(colored(f"[+] Creating captions", "blue"))
-        # Combine Clip Pieces
-        generator = lambda txt: TextClip(
-            txt,
-            font="../fonts/bold_font.ttf",
-            fontsize=fontSize,
-            color=fontOutline,
-            stroke_color=strokeColor,
-            stroke_width=5,
-        )
-
-        # Burn the subtitles into the video
-        subtitles = SubtitlesClip(subtitles_path, generator)
-        result = CompositeVideoClip([
-            VideoFileClip(clip_path),
-            subtitles.set_pos(("center", "center"))
-        ])
+        flask.Response: A JSON response indicating the status ('success' or 'error') and a message.
+    """
+    data = request.get_json(silent=True) or {}
+    job_id = data.get('jobId')
+    if not job_id:
+        return jsonify({"status": "error", "message": "A jobId is required."}), 400
 
-        # Add the audio
-        audio = AudioFileClip(audio_path)
-        result = result.set_audio(audio)
-        result.write_videofile(captioned_clip_path, threads=2)
-        print(colored(f"[+] Created Clip using AI", "green"))
-        return captioned_clip_path
-    except Exception as e:
-        return
-    
+    job = JOBS.cancel(job_id, data.get('subscription'))
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found."}), 404
 
-def trim_silences_from_video(video_path, silent_segments, strokeColor, fontOutline, fontSize):
+    if job.subscriptions:
+        return jsonify({"status": "success", "message": "Other requests still wait for this video, it keeps processing.", "jobId": job_id, "state": job.state})
+    print(colored(f"[!] Cancel requested for job {job_id}", "yellow"))
+    return jsonify({"status": "success", "message": "Video generation cancelled.", "jobId": job_id, "state": job.state})
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
     """
-    Trims silent segments from the video based on the provided silent segments list and generates a series of video clips without these silent parts. It also applies subtitles to these clips if necessary.
+    Handles the GET request to the `/api/jobs/<id>` endpoint and reports the state of a job.
 
     Args:
-        video_path (str): Path to the source video file.
-        silent_segments (List[Tuple[float, float]]): List of start and end times (in seconds) of silent segments to trim from the video.
-        strokeColor (str), fontOutline (str), fontSize (int): Styling parameters for the subtitles.
+        job_id (str): The ID returned by `/api/generate`.
 
     Returns:
-        List[str]: A list of paths to the generated video clips without silent segments, with subtitles applied if specified.
-    """
-
-    video = VideoFileClip(video_path)
-    video_duration = video.duration  # Get the duration of the video
-    clips = []
-    name = len(clips)
-    for start, end in silent_segments:
-        # Ensure the start and end times are within the video's duration
-        if start < video_duration and end < video_duration:
-            final_video_path = createClip(
-                video_path=video_path, 
-                start=start, 
-                end=end, 
-                name=name,
-                strokeColor=strokeColor, 
-                fontOutline=fontOutline, 
-                fontSize=fontSize, 
-                )
-        elif end >= video_duration:
-            final_video_path = createClip(
-                video_path=video_path, 
-                start=start, 
-                end=(end - 1), 
-                name=name,
-                strokeColor=strokeColor, 
-                fontOutline=fontOutline, 
-                fontSize=fontSize,             
-                    )
-            if len(final_video_path):
-                clips.append(final_video_path)
-            return
-    video.close()  # Close the original video clip
-    return clips
+        flask.Response: A JSON response with the job state, its predicted ETA in seconds under 'eta' and, once it has succeeded, the path to the processed video under 'clips'.
+    """
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found."}), 404
+
+    response = job.to_dict()
+    response["status"] = job.state
+    if job.result:
+        response["clips"] = job.result.get("clips")
+    return jsonify(response)
+
+
+@app.route("/api/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """
+    Handles the GET request to the `/api/jobs/<id>/events` endpoint. Streams the events of a job as server-sent events: 'state' events for job state changes, 'stage' events when a pipeline stage starts or finishes (with its duration) and 'progress' events with the download and frame render progress. The stream ends once the job has finished.
+
+    Args:
+        job_id (str): The ID returned by `/api/generate`.
+
+    Returns:
+        flask.Response: A `text/event-stream` response.
+    """
+    if JOBS.get(job_id) is None:
+        return jsonify({"status": "error", "message": "Job not found."}), 404
+
+    # Reconnecting EventSources resume after the last event they saw
+    try:
+        last_event_id = int(request.headers.get("Last-Event-ID", request.args.get("after", 0)))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Last-Event-ID and after must be event IDs."}), 400
+
+    def stream():
+        after = last_event_id
+        while True:
+            events, finished = JOBS.wait_events(job_id, after)
+            for event in events:
+                after = event["id"]
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            if finished:
+                break
+            if not events:
+                yield ": keep-alive\n\n"
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 if __name__ == '__main__':
-   # Run Flask App
-    app.run(debug=True, host=HOST, port=PORT)
+    # Start the render workers
+    JOBS.start()
+    # Run Flask App (the reloader would spawn a second worker pool)
+    app.run(debug=True, host=HOST, port=PORT, use_reloader=False, threaded=True)
@@ -0,0 +1,602 @@
+import os
+import time
+import numpy as np
+from moviepy.editor import VideoFileClip
+from whisperTS.main import create_sentences_from_audio, create_timed_sentences_from_audio, load_model
+from video import *
+from utils import *
+from jobs import CancelToken
+from progress import ProgressReporter
+from store import JobCheckpoints
+from ingest import SourceDownload
+from audio import ANALYSIS_SAMPLE_RATE, load_analysis_audio, audio_slice, write_wav
+from silence import split_stream, track_frame_powers
+from segments import SegmentSet
+from vad import VoiceActivityDetector, VAD_MIN_SILENCE_SECONDS, VAD_MIN_SPEECH_SECONDS
+from jumpcut import jump_cut_lines, subtitle_options, render_jump_cut
+from live import LiveRecorder, RollingWindow, SpeechSegmenter, resolve_stream_urls
+from ingest import MAX_SOURCE_SECONDS, select_video_format
+
+# How speech is found: "vad" (adaptive voice activity detection), "split" (everything within 30 dB of the loudest frame)
+# or "transcript" (the sentences of a single timestamped transcription, which also provides the captions)
+SEGMENTATION = os.getenv("SEGMENTATION", "vad")
+
+
+def warm_up() -> None:
+    """
+    Loads the whisper model before the first job, so every job of the worker reuses the same warm model.
+
+    Returns:
+        None
+    """
+    load_model("base")
+
+
+def run_job(job_id: str, params: dict, token: CancelToken, progress: ProgressReporter, checkpoints: JobCheckpoints) -> dict:
+    """
+    Runs the full generation pipeline for a single job: downloads the audio and video tracks in parallel, detects silent segments on the audio while the video is still downloading, renders the captioned clips and combines them. With SEGMENTATION set to 'transcript' the audio is transcribed once instead, and the timed sentences give both the segments and the captions of every clip. With 'jumpCut' set, the speech is joined into a single video by one ffmpeg render instead of rendering and combining clips. Stages with a valid checkpoint from an earlier run of the job are skipped.
+
+    Args:
+        job_id (str): The ID of the job being processed.
+        params (dict): The job parameters with the keys 'videoUrl', 'strokeColor', 'fontOutline', 'fontSize', 'captions', 'jumpCut' and optionally the 'ranges' of the video to process.
+        token (CancelToken): Checked between stages; the job stops with JobCancelled once it is set.
+        progress (ProgressReporter): Receives the stage transitions and render progress of the job.
+        checkpoints (JobCheckpoints): The stage checkpoints of the job.
+
+    Returns:
+        dict: The job result, containing the path to the combined video under 'clips'.
+    """
+    if params.get('live'):
+        return run_live_job(job_id, params, token, progress)
+    if params.get('progressive') and not params.get('ranges') and not params.get('jumpCut'):
+        return run_progressive_job(job_id, params, token, progress, checkpoints)
+
+    video_url = params.get('videoUrl')
+    strokeColor = params.get('strokeColor')
+    fontOutline = params.get('fontOutline')
+    fontSize = params.get('fontSize')
+    captions = params.get('captions', True)
+    token.raise_if_cancelled()
+
+    # Every file of this job lives in its own scratch tree
+    dirs = job_dirs(job_id)
+
+    # The job may have finished right before the worker died
+    final_stage = "jump_cut" if params.get('jumpCut') else "combine"
+    combined = checkpoints.load(final_stage)
+    if combined is not None:
+        progress.skip(final_stage)
+        return {"clips": combined["path"], "segments": combined["segments"]}
+
+    print(colored(f"[+] [{job_id}] Downloading with YTDLP", "blue"))
+    download = SourceDownload(video_url, dirs['source'], params.get("source"), lambda status, track: progress.download_hook(status, stage=f"download_{track}"), params.get("ranges"))
+    try:
+        # The video track downloads while the audio is analysed
+        if checkpoints.load("download_video") is None:
+            download.start("video")
+        audio = run_stage(checkpoints, progress, "download_audio", lambda: _fetched(download.audio(), "audio_path"))
+
+        token.raise_if_cancelled()
+        print(colored(f"[+] [{job_id}] Identifying Silences from Video", "blue"))
+        silence = run_stage(checkpoints, progress, "silence_detection", lambda: _detect_silences(audio["sections"]))
+        segments = len(silence["segments"])
+        progress.emit({"type": "analysis", "segments": segments})
+
+        token.raise_if_cancelled()
+        source = run_stage(checkpoints, progress, "download_video", lambda: _fetched(download.video(), "video_path"))
+    finally:
+        download.cancel()
+
+    token.raise_if_cancelled()
+    if params.get('jumpCut'):
+        print(colored(f"[+] [{job_id}] Rendering the jump cut", "blue"))
+        combined = run_stage(checkpoints, progress, "jump_cut", lambda: _jump_cut(source["sections"], audio["sections"], silence, params, dirs, token, progress))
+        remove_job_dir(job_id, keep_output=True)
+        return {"clips": combined["path"], "segments": segments}
+
+    print(colored(f"[+] [{job_id}] Creating Clips from video", "blue"))
+    video_clips = []
+    for video_section, audio_section in zip(source["sections"], audio["sections"]):
+        # Segments are in source time, the section's files start at its range
+        first, relative = _section_segments(silence["segments"], video_section)
+        transcript = _section_transcript(silence.get("transcript"), video_section)
+        video_clips += trim_silences_from_video(video_section["video_path"], relative, strokeColor, fontOutline, fontSize, dirs, token, progress, checkpoints, captions, audio_section["audio_path"], first, transcript)
+    if not video_clips:
+        raise RuntimeError("No clips could be rendered from the video.")
+
+    token.raise_if_cancelled()
+    combined = run_stage(checkpoints, progress, "combine", lambda: _combine(video_clips, segments, dirs, progress))
+
+    # Only the combined video is kept
+    remove_job_dir(job_id, keep_output=True)
+
+    return {"clips": combined["path"], "segments": segments}
+
+
+def run_live_job(job_id: str, params: dict, token: CancelToken, progress: ProgressReporter) -> dict:
+    """
+    Clips a live stream while it is being broadcast. The stream is recorded in segments, speech is segmented incrementally as every segment arrives and each clip is rendered and reported with a 'clip' event as soon as the silence after it begins. Only the segments an unfinished clip may still need are kept. The job ends with the stream, or after MAX_SOURCE_SECONDS of recording.
+
+    Args:
+        job_id (str): The ID of the job being processed.
+        params (dict): The job parameters with the keys 'videoUrl', 'strokeColor', 'fontOutline', 'fontSize' and 'captions'.
+        token (CancelToken): Checked between segments; the job stops with JobCancelled once it is set.
+        progress (ProgressReporter): Receives the stage transitions, clips and render progress of the job.
+
+    Returns:
+        dict: The job result, containing the paths to the clips under 'clips'.
+    """
+    dirs = job_dirs(job_id)
+    print(colored(f"[+] [{job_id}] Recording live stream", "blue"))
+    progress.stage("recording")
+    recorder = LiveRecorder(resolve_stream_urls(params['videoUrl']), dirs['source'], MAX_SOURCE_SECONDS or None)
+    try:
+        clips = _clip_stream(recorder, "recording", params, dirs, token, progress)
+    finally:
+        recorder.stop()
+
+    token.raise_if_cancelled()
+    remove_job_dir(job_id, keep_output=True)
+    if not clips:
+        raise RuntimeError("No speech was found in the stream.")
+    return {"clips": clips, "segments": len(clips)}
+
+
+def run_progressive_job(job_id: str, params: dict, token: CancelToken, progress: ProgressReporter, checkpoints: JobCheckpoints) -> dict:
+    """
+    Processes a video while it is still downloading. ffmpeg streams the video into segments; every completed segment extends the prefix that can be decoded safely, and segmentation and cutting advance over it like for a live stream, so the first clips are ready long before the download finishes. The clips are combined once the whole video has been processed. Rendered clips are checkpointed and reused if the job is resumed.
+
+    Args:
+        job_id (str): The ID of the job being processed.
+        params (dict): The job parameters with the keys 'videoUrl', 'strokeColor', 'fontOutline', 'fontSize' and 'captions'.
+        token (CancelToken): Checked between segments; the job stops with JobCancelled once it is set.
+        progress (ProgressReporter): Receives the stage transitions, clips, decodable prefix and render progress of the job.
+        checkpoints (JobCheckpoints): The stage checkpoints of the job.
+
+    Returns:
+        dict: The job result, containing the path to the combined video under 'clips'.
+    """
+    dirs = job_dirs(job_id)
+    combined = checkpoints.load("combine")
+    if combined is not None:
+        progress.skip("combine")
+        return {"clips": combined["path"], "segments": combined["segments"]}
+
+    print(colored(f"[+] [{job_id}] Streaming the video into segments", "blue"))
+    progress.stage("download")
+    recorder = LiveRecorder(resolve_stream_urls(params['videoUrl'], select_video_format), dirs['source'])
+    try:
+        duration = (params.get("source") or {}).get("duration")
+        clips = _clip_stream(recorder, "download", params, dirs, token, progress, checkpoints, duration)
+    finally:
+        recorder.stop()
+    if not clips:
+        raise RuntimeError("No clips could be rendered from the video.")
+    progress.emit({"type": "analysis", "segments": len(clips)})
+
+    token.raise_if_cancelled()
+    combined = run_stage(checkpoints, progress, "combine", lambda: _combine(clips, len(clips), dirs, progress))
+    remove_job_dir(job_id, keep_output=True)
+    return {"clips": combined["path"], "segments": len(clips)}
+
+
+def _clip_stream(recorder: LiveRecorder, stage: str, params: dict, dirs: dict, token: CancelToken, progress: ProgressReporter, checkpoints: JobCheckpoints = None, duration: float = None) -> list:
+    # Segments speech as the recorded segments complete and renders every clip once it closes
+    segmenter = SpeechSegmenter()
+    window = RollingWindow()
+    clips = []
+    closed = 0
+    for path, start, end in recorder.segments(token):
+        if duration:
+            # Everything up to the end of the last complete segment can be decoded safely
+            progress.emit({"type": "progress", "stage": stage, "bar": "seconds", "index": end, "total": duration, "percent": round(100 * min(end / duration, 1), 1)})
+        speech = segmenter.feed(window.add(path, start, end))
+        for clip_start, clip_end in speech:
+            token.raise_if_cancelled()
+            clips += _render_stream_clip(window, closed, clip_start, clip_end, params, dirs, progress, stage, checkpoints)
+            closed += 1
+        # Everything before the open clip (or the analysed audio, if none is open) is done with
+        window.release(segmenter.open_since if segmenter.open_since is not None else segmenter.time)
+    for clip_start, clip_end in segmenter.flush():
+        clips += _render_stream_clip(window, closed, clip_start, clip_end, params, dirs, progress, stage, checkpoints)
+        closed += 1
+    return clips
+
+
+def _render_stream_clip(window: RollingWindow, index: int, start: float, end: float, params: dict, dirs: dict, progress: ProgressReporter, stage: str, checkpoints: JobCheckpoints = None) -> list:
+    rendered = checkpoints.load(f"clip_{index}") if checkpoints is not None else None
+    if rendered is not None:
+        progress.skip("clip", clip=index)
+        return [rendered["path"]]
+
+    window_path, window_start, samples = window.cut(start, end, f"{dirs['source']}/window_{index}.mp4")
+    clip_path = createClip(
+        video_path=window_path,
+        start=start - window_start,
+        end=end - window_start,
+        name=index,
+        strokeColor=params.get('strokeColor'),
+        fontOutline=params.get('fontOutline'),
+        fontSize=params.get('fontSize'),
+        dirs=dirs,
+        progress=progress,
+        captions=params.get('captions', True),
+        audio=(samples, ANALYSIS_SAMPLE_RATE),
+        )
+    os.remove(window_path)
+    progress.stage(stage)
+    if not clip_path:
+        return []
+
+    output_path = f"{dirs['output']}/clip_{index}.mp4"
+    os.replace(clip_path, output_path)
+    clean_dir(dirs['clips'])
+    if checkpoints is not None:
+        checkpoints.save(f"clip_{index}", {"path": output_path}, [output_path])
+    progress.emit({"type": "clip", "clip": index, "path": output_path, "start": start, "end": end})
+    print(colored(f"[+] Clip {index} is ready: {output_path}", "green"))
+    return [output_path]
+
+
+def run_stage(checkpoints: JobCheckpoints, progress: ProgressReporter, stage: str, run, **info) -> dict:
+    """
+    Runs a pipeline stage and checkpoints it, or skips it if a valid checkpoint already exists.
+
+    Args:
+        checkpoints (JobCheckpoints): The stage checkpoints of the job.
+        progress (ProgressReporter): Receives the stage transition.
+        stage (str): The name of the stage.
+        run (Callable): Runs the stage and returns its artifacts and the list of files it produced.
+        **info: Extra details sent with the stage events.
+
+    Returns:
+        dict: The artifacts of the stage.
+    """
+    artifacts = checkpoints.load(stage)
+    if artifacts is not None:
+        print(colored(f"[+] Resuming after completed stage {stage}", "green"))
+        progress.skip(stage, **info)
+        return artifacts
+
+    progress.stage(stage, **info)
+    artifacts, files = run()
+    checkpoints.save(stage, artifacts, files)
+    return artifacts
+
+
+def _fetched(track: dict, path: str) -> tuple:
+    return track, [section[path] for section in track["sections"]]
+
+
+def _detect_silences(sections: list) -> tuple:
+    # The speech between the silences is what is cut into clips
+    speech_segments = []
+    transcript = [] if SEGMENTATION == "transcript" else None
+    for section in sections:
+        audio_path = section["audio_path"]
+        try:
+            segments, lines = _section_speech(audio_path)
+        except PermissionError:
+            print(f"Permission error when accessing {audio_path}. Retrying...")
+            time.sleep(20)  # Wait a bit for the file to be released
+            segments, lines = _section_speech(audio_path)
+        # Map the section's times back to source time
+        speech_segments += segments.shift(section["start"]).to_list()
+        if transcript is not None:
+            transcript += [dict(line, start=line["start"] + section["start"], end=line["end"] + section["start"]) for line in lines]
+    return {"segments": speech_segments, "transcript": transcript}, []
+
+
+def _section_speech(audio_path: str) -> tuple:
+    # Returns the speech segments of a section and, if they come from a transcription, its timed sentences
+    if SEGMENTATION == "transcript":
+        samples, _ = load_analysis_audio(audio_path)
+        # whisper wants a writable array
+        lines = create_timed_sentences_from_audio(np.array(samples))
+        return transcript_segments(lines), lines
+    return detect_speech_segments(audio_path), None
+
+
+def _section_segments(segments: list, section: dict) -> tuple:
+    # Returns the index of the section's first segment and its segments relative to the section
+    segments = SegmentSet(segments)
+    end = section["end"] if section["end"] is not None else np.inf
+    inside = (segments.starts >= section["start"]) & (segments.starts < end)
+    first = int(np.argmax(inside)) if inside.any() else 0
+    return first, segments[inside].shift(-section["start"]).to_list()
+
+
+def _section_transcript(transcript: list, section: dict) -> list:
+    # The transcript lines of a section relative to its start, None if the segments did not come from a transcription
+    if transcript is None:
+        return None
+    end = section["end"] if section["end"] is not None else np.inf
+    return [
+        dict(line, start=line["start"] - section["start"], end=line["end"] - section["start"])
+        for line in transcript
+        if section["start"] <= line["start"] < end
+    ]
+
+
+def _jump_cut(video_sections: list, audio_sections: list, silence: dict, params: dict, dirs: dict, token: CancelToken, progress: ProgressReporter) -> tuple:
+    # Renders the speech of every section into one video with a single encode
+    inputs = []
+    tracks = []
+    for video_section, audio_section in zip(video_sections, audio_sections):
+        samples, sample_rate = load_analysis_audio(audio_section["audio_path"])
+        _, relative = _section_segments(silence["segments"], video_section)
+        # Segments past the end of the section are dropped, the last one ends with it
+        inputs.append((video_section["video_path"], SegmentSet(relative).clip(len(samples) / sample_rate)))
+        tracks.append((samples, sample_rate))
+
+    subtitles = None
+    if params.get('captions', True):
+        lines = _jump_cut_transcript(inputs, tracks, video_sections, silence.get("transcript"))
+        if lines:
+            subtitles_path = generate_timed_subtitles(lines, directory=dirs['subtitles'])
+            subtitles = subtitle_options(subtitles_path, params.get('fontSize'), params.get('fontOutline'), params.get('strokeColor'), (params.get('source') or {}).get("height"))
+
+    def on_progress(seconds, total):
+        token.raise_if_cancelled()
+        progress.emit({"type": "progress", "stage": "jump_cut", "bar": "seconds", "index": round(seconds, 2), "total": round(total, 2), "percent": round(100 * seconds / total, 1) if total else None})
+
+    path = render_jump_cut(inputs, f"{dirs['output']}/jump_cut.mp4", subtitles=subtitles, on_progress=on_progress)
+    return {"path": path, "segments": len(silence["segments"])}, [path]
+
+
+def _jump_cut_transcript(inputs: list, tracks: list, video_sections: list, transcript: list = None) -> list:
+    # The timed sentences of the jump cut: moved from the transcript if the source has one, else transcribed in one pass over the kept audio
+    if transcript is None:
+        kept = [audio_slice(samples, sample_rate, start, end) for (_, segments), (samples, sample_rate) in zip(inputs, tracks) for start, end in segments]
+        # The joined audio is a writable copy, as whisper wants it
+        return create_timed_sentences_from_audio(np.concatenate(kept)) if kept else []
+    lines = []
+    offset = 0.0
+    for (_, segments), video_section in zip(inputs, video_sections):
+        section_lines = jump_cut_lines(_section_transcript(transcript, video_section), segments)
+        lines += [dict(line, start=line["start"] + offset, end=line["end"] + offset) for line in section_lines]
+        offset += float(segments.durations.sum())
+    return lines
+
+
+def _combine(video_clips: list, segments: int, dirs: dict, progress: ProgressReporter) -> tuple:
+    combined_video_path = combine_videos(video_clips, 500, 160, directory=dirs['output'], logger=progress.logger())
+    return {"path": combined_video_path, "segments": segments}, [combined_video_path]
+
+
+def detect_silent_segments(audio_path):
+    """
+    Detects silent segments within an audio file by analyzing its volume levels.
+
+    Args:
+        audio_path (str): Path to the audio file to analyze for silent segments.
+
+    Returns:
+        List[Tuple[float, float]]: A list of tuples, each representing the start and end times (in seconds) of silent segments within the audio file.
+    """
+    speech, duration = _find_speech(audio_path)
+    return speech.invert(duration).to_list()
+
+
+def detect_speech_segments(audio_path, segmentation=None):
+    """
+    Detects the segments of an audio file that are not silent, i.e. the parts of the video to keep.
+
+    Args:
+        audio_path (str): Path to the audio file to analyze.
+        segmentation (str): 'vad' for voice activity detection with an adaptive noise floor, hysteresis, minimum lengths and padding, or 'split' for every stretch louder than 30 dB below the loudest frame. SEGMENTATION if not given; 'transcript' detects voice activity, see `transcript_segments` for segments from a transcription.
+
+    Returns:
+        SegmentSet: The start and end times (in seconds) of the non-silent segments.
+    """
+    speech, _ = _find_speech(audio_path, segmentation)
+    return speech
+
+
+def _find_speech(audio_path, segmentation=None):
+    # Returns the speech segments and the duration of the track; memory stays small however long it is
+    if (segmentation or SEGMENTATION) == "split":
+        non_silent_segments, samples = split_stream(audio_path, top_db=30)
+        return SegmentSet.from_samples(non_silent_segments, ANALYSIS_SAMPLE_RATE), samples / ANALYSIS_SAMPLE_RATE
+    # Transcript segmentation needs a model, finding speech from the levels alone falls back to voice activity detection
+    powers, samples = track_frame_powers(audio_path)
+    duration = samples / ANALYSIS_SAMPLE_RATE
+    return VoiceActivityDetector().segments(powers, duration), duration
+
+
+def transcript_segments(lines, min_silence=VAD_MIN_SILENCE_SECONDS, min_speech=VAD_MIN_SPEECH_SECONDS):
+    """
+    Derives the speech segments from the timed sentences of a transcript: sentences separated by pauses shorter than `min_silence` are joined into one segment, the gaps between the segments are the silences.
+
+    Args:
+        lines (List[dict]): The 'start' and 'end' (in seconds) of every sentence, as returned by `create_timed_sentences_from_audio`.
+        min_silence (float): The shortest pause (in seconds) that separates two segments.
+        min_speech (float): The shortest segment (in seconds) that is kept.
+
+    Returns:
+        SegmentSet: The speech segments in seconds.
+    """
+    return SegmentSet([(line["start"], line["end"]) for line in lines]).merge(gap=min_silence).filter(min_speech)
+
+
+def invert_segments(segments, y_length, sr):
+    """
+    Inverts non-silent segments to identify silent segments in an audio track. This is useful for finding periods of silence between detected sounds.
+
+    Args:
+        segments (List[Tuple[int, int]]): A list of tuples representing the non-silent segments in samples, as returned by `librosa.effects.split`.
+        y_length (int): The total number of samples in the audio file.
+        sr (int): The sampling rate of the audio file.
+
+    Returns:
+        List[Tuple[float, float]]: A list of tuples, each indicating the start and end times (in seconds) of silent segments.
+    """
+    return SegmentSet.from_samples(segments, sr).invert(y_length / sr).to_list()
+
+
+def createClip(video_path, start, end, name, strokeColor, fontOutline, fontSize, dirs, progress=None, captions=True, audio=None, transcript=None):
+    print(colored(f"[+] Creating Clip using AI", "blue"))
+    """
+    Creates a video clip from the specified time segment, applies subtitles, and saves the clip to a file.
+
+    Args:
+        video_path (str): Path to the source video file.
+        start (float): The start time of the clip in the video (in seconds).
+        end (float): The end time of the clip in the video (in seconds).
+        name (str): A unique identifier for the output file.
+        strokeColor (str): Color for the stroke of the subtitle text.
+        fontOutline (str): Color for the font outline.
+        fontSize (int): Font size for the subtitles.
+        dirs (dict): The scratch directories of the job, as returned by `job_dirs`.
+        progress (ProgressReporter): Optional reporter for the cut, transcription and caption stages of the clip.
+        captions (bool): Whether to transcribe the clip and burn in subtitles.
+        audio (tuple): The samples and sample rate of the source's analysis track; the clip is transcribed from a slice of it instead of an audio file.
+        transcript (List[dict]): Optional timed sentences of the video; the captions are taken from it instead of transcribing the clip.
+
+    Returns:
+        str: The path to the output video file with the applied subtitles (or the plain clip without captions).
+    """
+
+    try:
+        # Define Stuff
+        clip_path = f"{dirs['clips']}/{name}.mp4"
+        captioned_clip_path = f"{dirs['clips']}/captioned_{name}.mp4"
+        audio_path = None
+        audio_clip = []
+        # Save Clip
+        _stage(progress, "cut", name)
+        video = VideoFileClip(video_path)
+        video.subclip(start, end).write_videofile(clip_path, fps=30, codec="libx264", logger=_logger(progress))
+        if not captions:
+            video.close()
+            return clip_path
+        if transcript is not None:
+            # The source has been transcribed already
+            subtitles_path = generate_timed_subtitles(_clip_lines(transcript, start, end), directory=dirs['subtitles'])
+        else:
+            # Generate Pieces
+            _stage(progress, "transcription", name)
+            audio_clip.append(video.subclip(start, end).audio)
+            if audio is not None:
+                samples, sample_rate = audio
+                clip_audio = audio_slice(samples, sample_rate, start, end)
+            else:
+                sample_rate = ANALYSIS_SAMPLE_RATE
+                clip_audio = audio_clip[0].to_soundarray(fps=sample_rate).mean(axis=1).astype("float32")
+            if ASSEMBLY_AI_API_KEY:
+                # AssemblyAI needs a file to upload
+                audio_path = write_wav(clip_audio, sample_rate, f"{dirs['clips']}/{name}.wav")
+            # whisper wants a writable array, the copy is only as long as the clip
+            stt = (create_sentences_from_audio(np.array(clip_audio))).split(". ")
+            stt = list(filter(lambda x: x != "", stt))
+            print(colored(f"[+] Creating subtitles with\n {stt}\n {audio_clip}\n", "blue"))
+            subtitles_path = generate_subtitles(
+                audio_path=audio_path,
+                sentences=stt,
+                audio_clips=audio_clip,
+                directory=dirs['subtitles'],
+                )
+        print(colored(f"[+] Creating captions", "blue"))
+        _stage(progress, "caption_burn", name)
+        # Combine Clip Pieces
+        generator = lambda txt: TextClip(
+            txt,
+            font="../fonts/bold_font.ttf",
+            fontsize=fontSize,
+            color=fontOutline,
+            stroke_color=strokeColor,
+            stroke_width=5,
+        )
+
+        # Burn the subtitles into the video
+        subtitles = SubtitlesClip(subtitles_path, generator)
+        clip = VideoFileClip(clip_path)
+        result = CompositeVideoClip([
+            clip,
+            subtitles.set_pos(("center", "center"))
+        ])
+
+        # Keep the cut's own audio
+        result = result.set_audio(clip.audio)
+        result.write_videofile(captioned_clip_path, threads=2, logger=_logger(progress))
+        print(colored(f"[+] Created Clip using AI", "green"))
+        return captioned_clip_path
+    except Exception as e:
+        return
+
+
+def _clip_lines(transcript, start, end):
+    # The transcript lines within a clip, cut to it and relative to its start
+    return [
+        dict(line, start=max(line["start"], start) - start, end=min(line["end"], end) - start)
+        for line in transcript
+        if line["end"] > start and line["start"] < end
+    ]
+
+
+def _stage(progress, name, clip):
+    if progress is not None:
+        progress.stage(name, clip=clip)
+
+
+def _logger(progress):
+    # moviepy's default console progress bar when there is no reporter
+    return progress.logger() if progress is not None else "bar"
+
+
+def trim_silences_from_video(video_path, segments, strokeColor, fontOutline, fontSize, dirs, token=None, progress=None, checkpoints=None, captions=True, audio_path=None, first_name=0, transcript=None):
+    """
+    Trims the silences from the video by cutting each of the given speech segments into its own clip, so the silent parts between them are left out. It also applies subtitles to these clips if necessary.
+
+    Args:
+        video_path (str): Path to the source video file.
+        segments (List[Tuple[float, float]]): List of start and end times (in seconds) of the speech segments to keep, as returned by `detect_speech_segments`.
+        strokeColor (str), fontOutline (str), fontSize (int): Styling parameters for the subtitles.
+        dirs (dict): The scratch directories of the job, as returned by `job_dirs`.
+        token (CancelToken): Optional cancellation token, checked before every clip.
+        progress (ProgressReporter): Optional reporter for the stages of every clip.
+        checkpoints (JobCheckpoints): Optional stage checkpoints; clips rendered by an earlier run of the job are reused.
+        captions (bool): Whether to transcribe the clips and burn in subtitles.
+        audio_path (str): Optional analysis track of the source, loaded once and sliced for the transcription of every clip.
+        first_name (int): The number of the first clip, so clips of several sections of a source get distinct names.
+        transcript (List[dict]): Optional timed sentences of the video, e.g. from transcript segmentation; the clips are captioned from it instead of being transcribed one by one.
+
+    Returns:
+        List[str]: A list of paths to the generated video clips without silent segments, with subtitles applied if specified.
+    """
+
+    video = VideoFileClip(video_path)
+    video_duration = video.duration  # Get the duration of the video
+    audio = load_analysis_audio(audio_path) if captions and audio_path and transcript is None else None
+    clips = []
+    # Segments past the end of the video are dropped, the last one ends with it
+    for name, (start, end) in enumerate(SegmentSet(segments).clip(video_duration), start=first_name):
+        if token is not None and token.cancelled:
+            video.close()
+            token.raise_if_cancelled()
+        rendered = checkpoints.load(f"clip_{name}") if checkpoints is not None else None
+        if rendered is not None:
+            if progress is not None:
+                progress.skip("clip", clip=name)
+            clips.append(rendered["path"])
+            continue
+        final_video_path = createClip(
+            video_path=video_path,
+            start=start,
+            end=end,
+            name=name,
+            strokeColor=strokeColor,
+            fontOutline=fontOutline,
+            fontSize=fontSize,
+            dirs=dirs,
+            progress=progress,
+            captions=captions,
+            audio=audio,
+            transcript=transcript,
+            )
+        if final_video_path:
+            clips.append(final_video_path)
+            if checkpoints is not None:
+                checkpoints.save(f"clip_{name}", {"path": final_video_path}, [final_video_path])
+    video.close()  # Close the original video clip
+    return clips
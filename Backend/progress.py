@@ -0,0 +1,149 @@
+import time
+
+from proglog import ProgressBarLogger
+
+# Minimum number of seconds between two frame progress events of the same bar
+PROGRESS_INTERVAL = 0.5
+
+
+class FrameProgressLogger(ProgressBarLogger):
+    """
+    proglog logger handed to moviepy's `write_videofile`/`write_audiofile` that forwards frame-level progress to the job's event stream.
+    """
+
+    def __init__(self, reporter, stage: str) -> None:
+        super().__init__()
+        self.reporter = reporter
+        self.stage = stage
+        self._last_sent = {}
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if attr != "index":
+            return
+        total = self.bars[bar].get("total") or 0
+        now = time.time()
+        done = total and value >= total - 1
+        if not done and now - self._last_sent.get(bar, 0) < PROGRESS_INTERVAL:
+            return
+        self._last_sent[bar] = now
+        self.reporter.emit({
+            "type": "progress",
+            "stage": self.stage,
+            "bar": bar,
+            "index": value,
+            "total": total,
+            "percent": round(100 * (value + 1) / total, 1) if total else None,
+        })
+
+
+class ProgressReporter:
+    """
+    Reports stage transitions and progress of a running job from the worker process to the API process.
+    """
+
+    def __init__(self, job_id: str, worker_id: int, events) -> None:
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.events = events
+        self._stage = None
+        self._stage_info = {}
+        self._stage_started_at = None
+        self._last_download_event = {}
+
+    def emit(self, event: dict) -> None:
+        """
+        Sends an event to the API process.
+
+        Args:
+            event (dict): The event; must contain a 'type' key.
+
+        Returns:
+            None
+        """
+        event["time"] = time.time()
+        self.events.put(("event", self.job_id, self.worker_id, event))
+
+    def stage(self, name: str, **info) -> None:
+        """
+        Marks the start of a pipeline stage, finishing the current one.
+
+        Args:
+            name (str): The name of the stage, e.g. 'download' or 'combine'.
+            **info: Extra details sent with the event, such as the clip number.
+
+        Returns:
+            None
+        """
+        self.finish_stage()
+        self._stage = name
+        self._stage_info = info
+        self._stage_started_at = time.time()
+        self.emit({"type": "stage", "stage": name, "status": "started", **info})
+
+    def finish_stage(self) -> None:
+        """
+        Marks the current stage as finished and reports how long it took.
+
+        Returns:
+            None
+        """
+        if self._stage is None:
+            return
+        elapsed = time.time() - self._stage_started_at
+        self.emit({"type": "stage", "stage": self._stage, "status": "finished", "elapsed": elapsed, **self._stage_info})
+        self._stage = None
+
+    def skip(self, name: str, **info) -> None:
+        """
+        Reports a stage that is skipped because its checkpoint from an earlier run is still valid.
+
+        Args:
+            name (str): The name of the stage.
+            **info: Extra details sent with the event, such as the clip number.
+
+        Returns:
+            None
+        """
+        self.finish_stage()
+        self.emit({"type": "stage", "stage": name, "status": "skipped", **info})
+
+    def logger(self, stage: str = None) -> FrameProgressLogger:
+        """
+        Creates a proglog logger that reports frame progress for a stage.
+
+        Args:
+            stage (str): The stage the progress belongs to, defaults to the current stage.
+
+        Returns:
+            FrameProgressLogger: The logger to pass to moviepy.
+        """
+        return FrameProgressLogger(self, stage or self._stage)
+
+    def download_hook(self, status: dict, stage: str = None) -> None:
+        """
+        yt_dlp progress hook reporting download progress.
+
+        Args:
+            status (dict): The status dictionary passed by yt_dlp.
+            stage (str): The stage the download belongs to, defaults to the current stage. Downloads running in the background of other stages pass their own.
+
+        Returns:
+            None
+        """
+        if status.get("status") != "downloading":
+            return
+        stage = stage or self._stage
+        now = time.time()
+        if now - self._last_download_event.get(stage, 0) < PROGRESS_INTERVAL:
+            return
+        self._last_download_event[stage] = now
+        total = status.get("total_bytes") or status.get("total_bytes_estimate")
+        downloaded = status.get("downloaded_bytes", 0)
+        self.emit({
+            "type": "progress",
+            "stage": stage,
+            "bar": "bytes",
+            "index": downloaded,
+            "total": total,
+            "percent": round(100 * downloaded / total, 1) if total else None,
+        })
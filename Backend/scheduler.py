@@ -0,0 +1,149 @@
+import os
+import time
+import numpy as np
+
+from statistics import median
+from scipy.optimize import nnls
+from dotenv import load_dotenv
+
+load_dotenv("../.env")
+
+# "sjf" runs the shortest expected job of a priority class first, "fifo" the oldest
+SCHEDULER_POLICY = os.getenv("SCHEDULER_POLICY", "sjf")
+
+# Seconds a job may wait before it jumps ahead of every non-starving job
+STARVATION_SECONDS = float(os.getenv("STARVATION_SECONDS", "1800"))
+
+# Processing seconds per second of source assumed until jobs have been measured
+DEFAULT_COST_PER_SECOND = float(os.getenv("DEFAULT_COST_PER_SECOND", "2.0"))
+
+# Priority classes, lower runs first
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+# Minimum number of measured jobs before the regression replaces the per-second estimate
+MIN_SAMPLES = 8
+
+# Detected segments per second of source assumed until jobs have been measured
+DEFAULT_SEGMENTS_PER_SECOND = 0.1
+
+
+def processed_seconds(params: dict) -> float:
+    """
+    Returns how much of the source a job processes: the length of its requested ranges, or the whole video.
+
+    Args:
+        params (dict): The job parameters, including the probed 'source'.
+
+    Returns:
+        float: The duration in seconds, or None if it is unknown.
+    """
+    if params.get("ranges"):
+        return sum(end - start for start, end in params["ranges"])
+    return (params.get("source") or {}).get("duration")
+
+
+def _features(duration: float, height: float, segments: float, captions: bool) -> list:
+    # Decode/download cost grows with duration and resolution, rendering with the
+    # number of clips and transcription/caption burn with the number of captioned clips
+    scale = (height or 1080) / 1080
+    return [1.0, duration, duration * scale, segments, segments if captions else 0.0]
+
+
+class CostModel:
+    """
+    Predicts the processing time of a job from its source duration, resolution, number of detected segments and whether captions are enabled. Every pipeline stage gets its own fit with non-negative least squares on the stage timings recorded for past jobs, so the work left of a job that has completed some stages can be predicted as well.
+    """
+
+    def __init__(self) -> None:
+        self.stage_coefficients = {}
+        self.cost_per_second = DEFAULT_COST_PER_SECOND
+        self.segments_per_second = DEFAULT_SEGMENTS_PER_SECOND
+
+    def fit(self, runs: list) -> None:
+        """
+        Fits the model to past jobs.
+
+        Args:
+            runs (list): Successful jobs as returned by `JobStore.recent_runs`.
+
+        Returns:
+            None
+        """
+        rows, timings, ratios, densities = [], [], [], []
+        for run in runs:
+            source = run["params"].get("source") or {}
+            duration = processed_seconds(run["params"])
+            if not duration:
+                continue
+            # The stages of every attempt, without the time a resumed job spent waiting; jobs recorded before stage timings were kept only have their wall time
+            stage_timings = run["stage_timings"]
+            cost = sum(stage_timings.values()) or run["finished_at"] - run["started_at"]
+            ratios.append(cost / duration)
+            segments = (run["result"] or {}).get("segments")
+            if segments is None or not stage_timings:
+                continue
+            densities.append(segments / duration)
+            rows.append(_features(duration, source.get("height"), segments, run["params"].get("captions", True)))
+            timings.append(stage_timings)
+
+        if ratios:
+            self.cost_per_second = median(ratios)
+        if densities:
+            self.segments_per_second = median(densities)
+        if len(rows) >= MIN_SAMPLES:
+            # A stage a job did not run (e.g. the jump cut of a clip job) cost it nothing
+            stages = sorted({stage for stage_timings in timings for stage in stage_timings})
+            self.stage_coefficients = {
+                stage: nnls(np.array(rows), np.array([stage_timings.get(stage, 0.0) for stage_timings in timings]))[0]
+                for stage in stages
+            }
+
+    def predict(self, params: dict, segments: int = None, done: dict = None) -> float:
+        """
+        Predicts how long a job takes to process, or how much of it is left.
+
+        Args:
+            params (dict): The job parameters, including the probed 'source'.
+            segments (int): The number of detected segments, if the job has been analysed already.
+            done (dict): The seconds the job has already spent in each stage, if it has started.
+
+        Returns:
+            float: The predicted (remaining) processing time in seconds, or None if the source duration is unknown.
+        """
+        source = params.get("source") or {}
+        duration = processed_seconds(params)
+        done = done or {}
+        if not duration:
+            return None
+        if not self.stage_coefficients:
+            return max(0.0, duration * self.cost_per_second - sum(done.values()))
+        if segments is None:
+            segments = duration * self.segments_per_second
+        features = _features(duration, source.get("height"), segments, params.get("captions", True))
+        # A stage that ran longer than predicted has nothing left, it does not shorten the others
+        return sum(
+            max(0.0, float(np.dot(coefficients, features)) - done.get(stage, 0.0))
+            for stage, coefficients in self.stage_coefficients.items()
+        )
+
+
+def schedule_key(job, expected_seconds: float, now: float = None) -> tuple:
+    """
+    Orders pending jobs: starving jobs first (oldest first), then by priority class, then by expected cost (SJF) or age (FIFO).
+
+    Args:
+        job (Job): The pending job.
+        expected_seconds (float): The predicted processing time of the job, or None if unknown.
+        now (float): The current time.
+
+    Returns:
+        tuple: The sort key; the job with the smallest key runs next.
+    """
+    now = now or time.time()
+    if now - job.created_at >= STARVATION_SECONDS:
+        return (0, 0, job.created_at, job.created_at)
+    priority = PRIORITIES.get(job.params.get("priority"), PRIORITIES["normal"])
+    if SCHEDULER_POLICY == "sjf":
+        cost = expected_seconds if expected_seconds is not None else float("inf")
+        return (1, priority, cost, job.created_at)
+    return (1, priority, job.created_at, job.created_at)
@@ -0,0 +1,175 @@
+import numpy as np
+
+
+class SegmentSet:
+    """
+    An ordered list of (start, end) time segments in seconds, backed by an (n, 2) NumPy array so that every operation works on all segments at once instead of looping over them in Python. Operations return new sets.
+    """
+
+    def __init__(self, segments=()) -> None:
+        """
+        Args:
+            segments: (start, end) pairs in seconds, e.g. a list of tuples or an (n, 2) array.
+        """
+        self.bounds = np.asarray(segments, dtype=np.float64).reshape(-1, 2)
+
+    @classmethod
+    def from_samples(cls, segments, sample_rate: int) -> "SegmentSet":
+        """
+        Builds a set from segments given in samples, e.g. the intervals of `librosa.effects.split`.
+
+        Args:
+            segments: (start, end) pairs in samples.
+            sample_rate (int): The sample rate the segments refer to.
+
+        Returns:
+            SegmentSet: The segments in seconds.
+        """
+        return cls(np.asarray(segments, dtype=np.float64).reshape(-1, 2) / sample_rate)
+
+    def to_samples(self, sample_rate: int) -> np.ndarray:
+        """
+        Converts the segments to sample indices.
+
+        Args:
+            sample_rate (int): The sample rate to convert to.
+
+        Returns:
+            np.ndarray: An (n, 2) integer array of (start, end) samples.
+        """
+        return np.round(self.bounds * sample_rate).astype(np.int64)
+
+    @property
+    def starts(self) -> np.ndarray:
+        """
+        np.ndarray: The start of every segment in seconds.
+        """
+        return self.bounds[:, 0]
+
+    @property
+    def ends(self) -> np.ndarray:
+        """
+        np.ndarray: The end of every segment in seconds.
+        """
+        return self.bounds[:, 1]
+
+    @property
+    def durations(self) -> np.ndarray:
+        """
+        np.ndarray: The length of every segment in seconds.
+        """
+        return self.bounds[:, 1] - self.bounds[:, 0]
+
+    def __len__(self) -> int:
+        return len(self.bounds)
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __getitem__(self, index) -> "SegmentSet":
+        return SegmentSet(self.bounds[index])
+
+    def __repr__(self) -> str:
+        return f"SegmentSet({self.to_list()!r})"
+
+    def to_list(self) -> list:
+        """
+        Returns:
+            list: The segments as (start, end) tuples of floats, e.g. for JSON checkpoints.
+        """
+        return [(float(start), float(end)) for start, end in self.bounds]
+
+    def sorted(self) -> "SegmentSet":
+        """
+        Returns:
+            SegmentSet: The segments ordered by their start.
+        """
+        return SegmentSet(self.bounds[np.argsort(self.starts, kind="stable")])
+
+    def merge(self, gap: float = 0.0) -> "SegmentSet":
+        """
+        Joins overlapping segments and segments separated by at most `gap` seconds.
+
+        Args:
+            gap (float): The longest gap (in seconds) that is closed.
+
+        Returns:
+            SegmentSet: The merged, sorted segments.
+        """
+        if not len(self):
+            return SegmentSet()
+        bounds = self.sorted().bounds
+        reach = np.maximum.accumulate(bounds[:, 1])
+        # A segment opens a new group if it starts after everything before it has ended (plus the gap)
+        first = np.concatenate([[0], np.flatnonzero(bounds[1:, 0] > reach[:-1] + gap) + 1])
+        return SegmentSet(np.column_stack([bounds[first, 0], np.maximum.reduceat(bounds[:, 1], first)]))
+
+    def invert(self, duration: float, start: float = 0.0) -> "SegmentSet":
+        """
+        Returns the gaps between the segments, e.g. the silences between speech.
+
+        Args:
+            duration (float): The end of the time range the gaps are taken from.
+            start (float): The beginning of that range.
+
+        Returns:
+            SegmentSet: The non-empty gaps within [start, duration].
+        """
+        merged = self.clip(duration, start).merge()
+        gaps = np.column_stack([
+            np.concatenate([[start], merged.ends]),
+            np.concatenate([merged.starts, [duration]]),
+        ])
+        return SegmentSet(gaps[gaps[:, 1] > gaps[:, 0]])
+
+    def pad(self, before: float, after: float = None) -> "SegmentSet":
+        """
+        Widens every segment. Padded segments may overlap; `merge` joins them.
+
+        Args:
+            before (float): Seconds added before every segment.
+            after (float): Seconds added after every segment, `before` if not given.
+
+        Returns:
+            SegmentSet: The padded segments.
+        """
+        after = before if after is None else after
+        return SegmentSet(self.bounds + np.array([-before, after]))
+
+    def clip(self, duration: float, start: float = 0.0) -> "SegmentSet":
+        """
+        Cuts the segments to a time range and drops those outside of it.
+
+        Args:
+            duration (float): The end of the range, e.g. the duration of the video.
+            start (float): The beginning of the range.
+
+        Returns:
+            SegmentSet: The segments within [start, duration].
+        """
+        bounds = np.clip(self.bounds, start, duration)
+        return SegmentSet(bounds[bounds[:, 1] > bounds[:, 0]])
+
+    def filter(self, min_length: float) -> "SegmentSet":
+        """
+        Drops the segments shorter than `min_length` seconds.
+
+        Args:
+            min_length (float): The shortest segment kept.
+
+        Returns:
+            SegmentSet: The segments of at least `min_length` seconds.
+        """
+        return SegmentSet(self.bounds[self.durations >= min_length])
+
+    def shift(self, offset: float) -> "SegmentSet":
+        """
+        Moves every segment by `offset` seconds, e.g. from section time to source time.
+
+        Args:
+            offset (float): The seconds to add.
+
+        Returns:
+            SegmentSet: The moved segments.
+        """
+        return SegmentSet(self.bounds + offset)
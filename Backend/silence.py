@@ -0,0 +1,218 @@
+import os
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+from dotenv import load_dotenv
+from audio import ANALYSIS_SAMPLE_RATE, pcm_blocks, load_analysis_audio
+
+load_dotenv("../.env")
+
+# Frame and hop length (in samples) of the level analysis, the defaults of `librosa.effects.split`
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+
+# Smallest power taken into account when converting to dB, as in `librosa.power_to_db`
+AMIN = 1e-10
+
+# Threads analysing an analysis track in parallel (all CPUs if unset), 1 analyses it serially
+ANALYSIS_THREADS = int(os.getenv("ANALYSIS_THREADS") or os.cpu_count() or 1)
+
+# Frames analysed per parallel chunk (2048 frames are about a minute at 16 kHz)
+CHUNK_FRAMES = 2048
+
+
+class SilenceSplitter:
+    """
+    Streaming equivalent of `librosa.effects.split`: finds the non-silent intervals of a signal that arrives block by block. Frames are centred and zero-padded and their mean-square power is compared in dB against the loudest frame of the whole signal, exactly like librosa does, but only a few hops of audio are held at a time. As the reference is global, the signal is read twice: once by `reference` and once by `split`.
+    """
+
+    def __init__(self, top_db: float = 30, frame_length: int = FRAME_LENGTH, hop_length: int = HOP_LENGTH) -> None:
+        """
+        Args:
+            top_db (float): How far (in dB) below the reference a frame counts as silent.
+            frame_length (int): The number of samples per analysis frame, a multiple of twice the hop length.
+            hop_length (int): The number of samples between two frames.
+        """
+        if frame_length % (2 * hop_length):
+            raise ValueError("frame_length must be a multiple of twice hop_length.")
+        self.top_db = top_db
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        # Samples read by the last pass
+        self.samples = 0
+
+    def reference(self, blocks) -> float:
+        """
+        Finds the power of the loudest frame, the 0 dB reference of `split`.
+
+        Args:
+            blocks (Iterable[np.ndarray]): The blocks of the signal.
+
+        Returns:
+            float: The largest frame power.
+        """
+        return max((float(powers.max()) for powers in self.frame_powers(blocks) if len(powers)), default=0.0)
+
+    def split(self, blocks, reference: float):
+        """
+        Finds the non-silent intervals of a signal, yielding every interval as soon as it ends.
+
+        Args:
+            blocks (Iterable[np.ndarray]): The blocks of the signal.
+            reference (float): The power that corresponds to 0 dB, as returned by `reference`.
+
+        Yields:
+            tuple: The start and end sample of a non-silent interval.
+        """
+        return self.intervals(self.frame_powers(blocks), reference)
+
+    def intervals(self, frame_powers, reference: float):
+        """
+        Turns frame powers into non-silent intervals, yielding every interval as soon as it ends.
+
+        Args:
+            frame_powers (Iterable[np.ndarray]): The powers of all frames of the signal in order, in arrays of any size.
+            reference (float): The power that corresponds to 0 dB.
+
+        Yields:
+            tuple: The start and end sample of a non-silent interval.
+        """
+        threshold = 10 * np.log10(max(AMIN, reference)) - self.top_db
+        frame = 0
+        start = None
+        for powers in frame_powers:
+            loud = 10 * np.log10(np.maximum(AMIN, powers)) > threshold
+            # Positions where a frame differs from the one before it
+            changes = np.flatnonzero(np.diff(np.concatenate([[start is not None], loud]).astype(np.int8)))
+            for index in changes:
+                if loud[index]:
+                    start = int(frame + index) * self.hop_length
+                else:
+                    yield start, int(frame + index) * self.hop_length
+                    start = None
+            frame += len(loud)
+        if start is not None:
+            yield start, min(frame * self.hop_length, self.samples)
+
+    def frame_powers(self, blocks):
+        """
+        Computes the mean-square power of the centred frames of a signal as it arrives.
+
+        Args:
+            blocks (Iterable[np.ndarray]): The blocks of the signal.
+
+        Yields:
+            np.ndarray: The powers of the frames that are complete, in order.
+        """
+        hops_per_frame = self.frame_length // self.hop_length
+        padding = np.zeros(self.frame_length // 2)
+        rest = padding
+        hop_powers = np.zeros(0)
+        self.samples = 0
+        for block in _then(blocks, padding):
+            if block is not padding:
+                self.samples += len(block)
+            samples = np.concatenate([rest, block])
+            count = len(samples) // self.hop_length
+            rest = samples[count * self.hop_length:]
+            # Summing the power per hop squares every sample once, frames are sums of neighbouring hops
+            hop_powers = np.concatenate([hop_powers, np.square(samples[:count * self.hop_length], dtype=np.float64).reshape(count, self.hop_length).sum(axis=1)])
+            frames = len(hop_powers) - hops_per_frame + 1
+            if frames > 0:
+                yield sliding_window_view(hop_powers, hops_per_frame).sum(axis=1) / self.frame_length
+                hop_powers = hop_powers[frames:]
+
+    def frame_powers_range(self, samples: np.ndarray, first: int, last: int) -> np.ndarray:
+        """
+        Computes the powers of a range of frames of a signal that is fully available, e.g. a mapped analysis track. The hops are aligned exactly like in `frame_powers`, so the powers are bit for bit the same.
+
+        Args:
+            samples (np.ndarray): The whole signal.
+            first (int): The first frame.
+            last (int): The frame after the last one.
+
+        Returns:
+            np.ndarray: The powers of the frames.
+        """
+        hops_per_frame = self.frame_length // self.hop_length
+        # Frames are centred, frame i starts half a frame before sample i * hop_length
+        start = first * self.hop_length - self.frame_length // 2
+        stop = (last + hops_per_frame - 1) * self.hop_length - self.frame_length // 2
+        chunk = np.zeros(stop - start)
+        within = slice(max(start, 0), min(stop, len(samples)))
+        if within.stop > within.start:
+            chunk[within.start - start:within.stop - start] = samples[within]
+        hop_powers = np.square(chunk).reshape(-1, self.hop_length).sum(axis=1)
+        return sliding_window_view(hop_powers, hops_per_frame).sum(axis=1) / self.frame_length
+
+
+def _then(blocks, last):
+    yield from blocks
+    yield last
+
+
+def split_stream(media_path: str, top_db: float = 30, sample_rate: int = ANALYSIS_SAMPLE_RATE, threads: int = ANALYSIS_THREADS) -> tuple:
+    """
+    Finds the non-silent intervals of a media file with constant memory, decoding it twice through an ffmpeg pipe. Analysis tracks are analysed by `split_parallel` when more than one thread is allowed.
+
+    Args:
+        media_path (str): The path to the video or audio file.
+        top_db (float): How far (in dB) below the loudest frame a frame counts as silent.
+        sample_rate (int): The sample rate to analyse at.
+        threads (int): The number of threads an analysis track may be analysed with.
+
+    Returns:
+        tuple: The (start, end) sample intervals and the length of the signal in samples.
+    """
+    if threads > 1 and media_path.endswith(".npy") and sample_rate == ANALYSIS_SAMPLE_RATE:
+        return split_parallel(media_path, top_db, threads)
+
+    splitter = SilenceSplitter(top_db)
+    reference = splitter.reference(pcm_blocks(media_path, sample_rate))
+    intervals = list(splitter.split(pcm_blocks(media_path, sample_rate), reference))
+    return intervals, splitter.samples
+
+
+def split_parallel(audio_path: str, top_db: float = 30, threads: int = ANALYSIS_THREADS) -> tuple:
+    """
+    Finds the non-silent intervals of an analysis track on several cores, see `track_frame_powers`. The result is exactly the one of the serial analysis.
+
+    Args:
+        audio_path (str): The path to the analysis track, as written by `extract_analysis_audio`.
+        top_db (float): How far (in dB) below the loudest frame a frame counts as silent.
+        threads (int): The number of threads.
+
+    Returns:
+        tuple: The (start, end) sample intervals and the length of the signal in samples.
+    """
+    splitter = SilenceSplitter(top_db)
+    powers, splitter.samples = track_frame_powers(audio_path, threads)
+    return list(splitter.intervals([powers], float(powers.max()))), splitter.samples
+
+
+def track_frame_powers(media_path: str, threads: int = ANALYSIS_THREADS, sample_rate: int = ANALYSIS_SAMPLE_RATE) -> tuple:
+    """
+    Computes the powers of all frames of a media file. Analysis tracks are analysed on several cores: the frames are split into chunks of CHUNK_FRAMES whose samples overlap by a frame, the chunks are analysed on a thread pool (NumPy releases the GIL while it crunches the samples, and every thread reads the same mapped file) and stitched back together in order. Other files are streamed. Either way the powers are the ones `SilenceSplitter.frame_powers` computes, bit for bit.
+
+    Args:
+        media_path (str): The path to the analysis track or any other media file.
+        threads (int): The number of threads an analysis track may be analysed with.
+        sample_rate (int): The sample rate to analyse at.
+
+    Returns:
+        tuple: The powers of the frames and the length of the signal in samples.
+    """
+    splitter = SilenceSplitter()
+    if threads > 1 and media_path.endswith(".npy") and sample_rate == ANALYSIS_SAMPLE_RATE:
+        samples, _ = load_analysis_audio(media_path)
+        frames = 1 + len(samples) // splitter.hop_length
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            powers = list(executor.map(
+                lambda first: splitter.frame_powers_range(samples, first, min(first + CHUNK_FRAMES, frames)),
+                range(0, frames, CHUNK_FRAMES),
+            ))
+        return np.concatenate(powers), len(samples)
+
+    powers = list(splitter.frame_powers(pcm_blocks(media_path, sample_rate)))
+    return np.concatenate(powers), splitter.samples
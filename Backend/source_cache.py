@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+
+from filelock import FileLock, Timeout
+from termcolor import colored
+from dotenv import load_dotenv
+
+load_dotenv("../.env")
+
+# Directory of the persistent source cache
+SOURCE_CACHE_DIR = os.getenv("SOURCE_CACHE_DIR", "../cache/sources")
+
+# Size the cache is trimmed to (least recently used entries are evicted first)
+SOURCE_CACHE_MAX_BYTES = int(float(os.getenv("SOURCE_CACHE_MAX_GB", "50")) * 1024 ** 3)
+
+# Bytes hashed at the start and at the end of every file to check it on a cache hit
+SAMPLE_BYTES = 1024 * 1024
+
+# Age in seconds after which staging directories of interrupted puts and lock files of evicted entries are removed
+STALE_SECONDS = 3600
+
+MANIFEST = "manifest.json"
+
+
+def cache_key(*parts: str) -> str:
+    """
+    Builds the content address of a cached source.
+
+    Args:
+        *parts (str): What identifies the source, e.g. extractor, video ID and format.
+
+    Returns:
+        str: The cache key.
+    """
+    return hashlib.sha256("\0".join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def _sampled_digest(path: str) -> str:
+    # Hash of the size plus the first and last SAMPLE_BYTES, cheap even for multi-GB files
+    digest = hashlib.sha256()
+    size = os.path.getsize(path)
+    digest.update(str(size).encode())
+    with open(path, "rb") as file:
+        digest.update(file.read(SAMPLE_BYTES))
+        if size > SAMPLE_BYTES:
+            file.seek(max(SAMPLE_BYTES, size - SAMPLE_BYTES))
+            digest.update(file.read(SAMPLE_BYTES))
+    return digest.hexdigest()
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(SAMPLE_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SourceCache:
+    """
+    Persistent, size-bounded LRU cache of downloaded sources. Each entry is a directory named after its content address holding the media files and a manifest with their sizes and digests.
+    """
+
+    def __init__(self, root: str = SOURCE_CACHE_DIR, max_bytes: int = SOURCE_CACHE_MAX_BYTES) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def lock(self, key: str) -> FileLock:
+        """
+        Returns the lock of an entry; hold it while filling the entry so concurrent jobs download a source only once.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            FileLock: The inter-process lock of the entry.
+        """
+        return FileLock(os.path.join(self.root, f"{key}.lock"))
+
+    def get(self, key: str) -> dict:
+        """
+        Looks up an entry and checks its files. Corrupt entries are removed.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            dict: The paths of the cached files by name plus the stored 'meta' data, or None on a miss.
+        """
+        entry = os.path.join(self.root, key)
+        manifest_path = os.path.join(entry, MANIFEST)
+        if not os.path.isfile(manifest_path):
+            return None
+
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        files = {}
+        for name, recorded in manifest["files"].items():
+            path = os.path.join(entry, recorded["file"])
+            if not os.path.isfile(path) or os.path.getsize(path) != recorded["size"] or _sampled_digest(path) != recorded["sample"]:
+                print(colored(f"[-] Cached source {key} is corrupt, discarding it", "yellow"))
+                shutil.rmtree(entry, ignore_errors=True)
+                return None
+            files[name] = path
+
+        # The manifest's mtime is the entry's last access for LRU eviction
+        os.utime(manifest_path)
+        return {"files": files, "meta": manifest.get("meta", {})}
+
+    def put(self, key: str, files: dict, meta: dict = None, digests: dict = None) -> dict:
+        """
+        Moves downloaded files into the cache. Hold the entry's lock while calling it.
+
+        Args:
+            key (str): The cache key.
+            files (dict): The paths of the files to cache by name, e.g. {'video': ..., 'audio': ...}. They are moved, not copied.
+            meta (dict): JSON-serializable data stored with the entry.
+            digests (dict): Already known SHA-256 digests of the files by name, e.g. computed while they were received.
+
+        Returns:
+            dict: The entry as returned by `get`.
+        """
+        staging = os.path.join(self.root, f"{key}.tmp-{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        manifest = {"created": time.time(), "meta": meta or {}, "files": {}}
+        for name, path in files.items():
+            filename = f"{name}{os.path.splitext(path)[1]}"
+            target = os.path.join(staging, filename)
+            shutil.move(path, target)
+            manifest["files"][name] = {
+                "file": filename,
+                "size": os.path.getsize(target),
+                "sample": _sampled_digest(target),
+                "sha256": (digests or {}).get(name) or _file_digest(target),
+            }
+        with open(os.path.join(staging, MANIFEST), "w") as file:
+            json.dump(manifest, file)
+
+        entry = os.path.join(self.root, key)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(staging, entry)
+        self.evict(keep=key)
+        return self.get(key)
+
+    def evict(self, keep: str = None) -> None:
+        """
+        Removes the least recently used entries until the cache fits into its size limit, plus what interrupted puts left behind. Entries whose lock is held, e.g. while a job links their files, are skipped.
+
+        Args:
+            keep (str): A key that must not be evicted, e.g. the entry that was just added.
+
+        Returns:
+            None
+        """
+        self._remove_leftovers()
+        entries = []
+        total = 0
+        for key in os.listdir(self.root):
+            manifest_path = os.path.join(self.root, key, MANIFEST)
+            if not os.path.isfile(manifest_path):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(self.root, key, name))
+                for name in os.listdir(os.path.join(self.root, key))
+            )
+            entries.append((os.path.getmtime(manifest_path), key, size))
+            total += size
+
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            lock = self.lock(key)
+            try:
+                lock.acquire(timeout=0)
+            except Timeout:
+                continue
+            try:
+                print(colored(f"[+] Evicting cached source {key}", "blue"))
+                shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+                total -= size
+            finally:
+                lock.release()
+
+    def _remove_leftovers(self) -> None:
+        # Staging directories of puts that died halfway, and lock files of entries that are gone
+        now = time.time()
+        names = os.listdir(self.root)
+        for name in names:
+            path = os.path.join(self.root, name)
+            key, staging, _ = name.partition(".tmp-")
+            if not staging:
+                if not name.endswith(".lock"):
+                    continue
+                key = name[:-len(".lock")]
+                if os.path.isdir(os.path.join(self.root, key)) or any(other.startswith(f"{key}.tmp-") for other in names):
+                    continue
+            try:
+                if now - os.path.getmtime(path) < STALE_SECONDS:
+                    continue
+            except OSError:
+                continue
+            lock = self.lock(key)
+            try:
+                lock.acquire(timeout=0)
+            except Timeout:
+                continue
+            try:
+                if staging:
+                    print(colored(f"[+] Removing interrupted cache write {name}", "blue"))
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+            except OSError:
+                pass
+            finally:
+                lock.release()
+
+
+def link_into(path: str, directory: str) -> str:
+    """
+    Makes a cached file available in a job's directory, as a hard link where possible so later evictions cannot pull it away from under the job.
+
+    Args:
+        path (str): The path of the cached file.
+        directory (str): The directory to link it into.
+
+    Returns:
+        str: The path the job should use.
+    """
+    target = os.path.join(directory, os.path.basename(path))
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(path, target)
+        return target
+    except OSError:
+        # Different filesystems (e.g. scratch on tmpfs): read straight from the cache
+        return path
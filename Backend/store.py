@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv("../.env")
+
+# SQLite database recording jobs and their completed stages
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "../jobs.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    stage_timings TEXT,
+    last_event_id INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    subscriptions TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    job_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    artifacts TEXT NOT NULL,
+    completed_at REAL NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+CREATE TABLE IF NOT EXISTS batches (
+    id TEXT PRIMARY KEY,
+    job_ids TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# Columns added after the first release, added to databases created before them
+MIGRATIONS = (
+    ("jobs", "last_event_id", "INTEGER NOT NULL DEFAULT 0"),
+    ("jobs", "attempts", "INTEGER NOT NULL DEFAULT 0"),
+    ("jobs", "subscriptions", "TEXT"),
+)
+
+
+class JobStore:
+    """
+    Embedded SQLite store for job parameters, states and stage checkpoints. It is shared by the API process and the worker processes; every thread gets its own connection.
+    """
+
+    def __init__(self, path: str = JOB_DB_PATH) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        connection = self._connection()
+        for table, column, definition in MIGRATIONS:
+            columns = [row["name"] for row in connection.execute(f"PRAGMA table_info({table})")]
+            if column not in columns:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            # WAL lets the workers write checkpoints while the API process reads
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def save_job(self, job) -> None:
+        """
+        Inserts or updates a job.
+
+        Args:
+            job (Job): The job to save.
+
+        Returns:
+            None
+        """
+        self._connection().execute(
+            """
+            INSERT INTO jobs (id, params, state, result, error, stage_timings, last_event_id, attempts, subscriptions, created_at, started_at, finished_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET
+                state = excluded.state,
+                result = excluded.result,
+                error = excluded.error,
+                stage_timings = excluded.stage_timings,
+                last_event_id = excluded.last_event_id,
+                attempts = excluded.attempts,
+                subscriptions = excluded.subscriptions,
+                started_at = excluded.started_at,
+                finished_at = excluded.finished_at
+            """,
+            (
+                job.id,
+                json.dumps(job.params),
+                job.state,
+                json.dumps(job.result),
+                job.error,
+                json.dumps(job.stage_timings),
+                job.last_event_id,
+                job.attempts,
+                json.dumps(sorted(job.subscriptions)),
+                job.created_at,
+                job.started_at,
+                job.finished_at,
+            ),
+        )
+
+    def save_event_id(self, job_id: str, last_event_id: int) -> None:
+        """
+        Records the ID of the last event of a job, so a resumed job continues the numbering its clients have seen.
+
+        Args:
+            job_id (str): The ID of the job.
+            last_event_id (int): The ID of its last event.
+
+        Returns:
+            None
+        """
+        self._connection().execute("UPDATE jobs SET last_event_id = ? WHERE id = ?", (last_event_id, job_id))
+
+    def load_jobs(self, states: tuple) -> list:
+        """
+        Loads every job in one of the given states, oldest first.
+
+        Args:
+            states (tuple): The job states to load.
+
+        Returns:
+            list: The jobs as dictionaries with decoded 'params', 'result', 'stage_timings' and 'subscriptions'.
+        """
+        placeholders = ", ".join("?" for _ in states)
+        rows = self._connection().execute(
+            f"SELECT * FROM jobs WHERE state IN ({placeholders}) ORDER BY created_at",
+            tuple(states),
+        ).fetchall()
+        return [_decode_job(row) for row in rows]
+
+    def load_job(self, job_id: str) -> dict:
+        """
+        Loads a single job.
+
+        Args:
+            job_id (str): The ID of the job.
+
+        Returns:
+            dict: The job as a dictionary with decoded 'params', 'result', 'stage_timings' and 'subscriptions', or None if it does not exist.
+        """
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _decode_job(row) if row else None
+
+    def recent_runs(self, limit: int = 50) -> list:
+        """
+        Loads the most recent successful jobs, used to measure how long processing takes.
+
+        Args:
+            limit (int): The maximum number of jobs to load.
+
+        Returns:
+            list: The jobs as dictionaries, newest first.
+        """
+        rows = self._connection().execute(
+            "SELECT * FROM jobs WHERE state = 'succeeded' AND started_at IS NOT NULL ORDER BY finished_at DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return [_decode_job(row) for row in rows]
+
+    def save_batch(self, batch_id: str, job_ids: list) -> None:
+        """
+        Records a batch of jobs submitted together.
+
+        Args:
+            batch_id (str): The ID of the batch.
+            job_ids (list): The IDs of the batch's jobs, in submission order.
+
+        Returns:
+            None
+        """
+        self._connection().execute(
+            "INSERT INTO batches (id, job_ids, created_at) VALUES (?, ?, ?)",
+            (batch_id, json.dumps(job_ids), time.time()),
+        )
+
+    def load_batch(self, batch_id: str) -> list:
+        """
+        Loads the job IDs of a batch.
+
+        Args:
+            batch_id (str): The ID of the batch.
+
+        Returns:
+            list: The IDs of the batch's jobs, or None if the batch does not exist.
+        """
+        row = self._connection().execute("SELECT job_ids FROM batches WHERE id = ?", (batch_id,)).fetchone()
+        return json.loads(row["job_ids"]) if row else None
+
+    def record_stage(self, job_id: str, stage: str, artifacts: dict) -> None:
+        """
+        Records that a stage of a job has completed, together with what it produced.
+
+        Args:
+            job_id (str): The ID of the job.
+            stage (str): The name of the stage.
+            artifacts (dict): JSON-serializable outputs of the stage.
+
+        Returns:
+            None
+        """
+        self._connection().execute(
+            "INSERT OR REPLACE INTO checkpoints (job_id, stage, artifacts, completed_at) VALUES (?, ?, ?, ?)",
+            (job_id, stage, json.dumps(artifacts), time.time()),
+        )
+
+    def get_stage(self, job_id: str, stage: str) -> dict:
+        """
+        Looks up the checkpoint of a stage.
+
+        Args:
+            job_id (str): The ID of the job.
+            stage (str): The name of the stage.
+
+        Returns:
+            dict: The artifacts recorded for the stage, or None if it has not completed.
+        """
+        row = self._connection().execute(
+            "SELECT artifacts FROM checkpoints WHERE job_id = ? AND stage = ?",
+            (job_id, stage),
+        ).fetchone()
+        return json.loads(row["artifacts"]) if row else None
+
+    def clear_stages(self, job_id: str) -> None:
+        """
+        Removes every checkpoint of a job.
+
+        Args:
+            job_id (str): The ID of the job.
+
+        Returns:
+            None
+        """
+        self._connection().execute("DELETE FROM checkpoints WHERE job_id = ?", (job_id,))
+
+
+def _decode_job(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    job["stage_timings"] = json.loads(job["stage_timings"]) if job["stage_timings"] else {}
+    job["subscriptions"] = json.loads(job["subscriptions"]) if job["subscriptions"] else []
+    return job
+
+
+class JobCheckpoints:
+    """
+    The stage checkpoints of a single job. A checkpoint is only returned while every file it produced is still on disk with its recorded size, so stale or truncated outputs are re-done.
+    """
+
+    def __init__(self, store: JobStore, job_id: str) -> None:
+        self.store = store
+        self.job_id = job_id
+
+    def load(self, stage: str) -> dict:
+        """
+        Returns the artifacts of a completed stage whose files are still valid.
+
+        Args:
+            stage (str): The name of the stage.
+
+        Returns:
+            dict: The recorded artifacts, or None if the stage has to run (again).
+        """
+        artifacts = self.store.get_stage(self.job_id, stage)
+        if artifacts is None:
+            return None
+        for path, size in artifacts.get("files", {}).items():
+            if not os.path.isfile(path) or os.path.getsize(path) != size:
+                return None
+        return artifacts
+
+    def save(self, stage: str, artifacts: dict, files: list = ()) -> None:
+        """
+        Records a completed stage.
+
+        Args:
+            stage (str): The name of the stage.
+            artifacts (dict): JSON-serializable outputs of the stage.
+            files (list): Paths of the files the stage produced.
+
+        Returns:
+            None
+        """
+        artifacts = dict(artifacts, files={path: os.path.getsize(path) for path in files})
+        self.store.record_stage(self.job_id, stage, artifacts)
@@ -0,0 +1,63 @@
+import pytest
+
+from jumpcut import jump_cut_filter, jump_cut_lines, subtitle_options
+from segments import SegmentSet
+
+VERTICAL = "crop='min(iw,ih*1080/1920)':'min(ih,iw*1920/1080)',scale=1080:1920,setsar=1,fps=30"
+
+
+def test_two_segment_cut_graph():
+    graph = jump_cut_filter([SegmentSet([(1, 2.5), (4, 6)])])
+
+    assert graph.split(";\n") == [
+        "[0:v]split=2[sv0_0][sv0_1]",
+        "[0:a]asplit=2[sa0_0][sa0_1]",
+        "[sv0_0]trim=start=1.000000:end=2.500000,setpts=PTS-STARTPTS[v0_0]",
+        "[sa0_0]atrim=start=1.000000:end=2.500000,asetpts=PTS-STARTPTS[a0_0]",
+        "[sv0_1]trim=start=4.000000:end=6.000000,setpts=PTS-STARTPTS[v0_1]",
+        "[sa0_1]atrim=start=4.000000:end=6.000000,asetpts=PTS-STARTPTS[a0_1]",
+        "[v0_0][a0_0][v0_1][a0_1]concat=n=2:v=1:a=1[joined][a]",
+        f"[joined]{VERTICAL}[v]",
+    ]
+
+
+def test_graph_without_audio_skips_empty_inputs_and_burns_captions():
+    graph = jump_cut_filter([SegmentSet(), SegmentSet([(0, 1)])], audio=False, subtitles="filename='a.srt'")
+
+    assert graph.split(";\n") == [
+        "[1:v]split=1[sv1_0]",
+        "[sv1_0]trim=start=0.000000:end=1.000000,setpts=PTS-STARTPTS[v1_0]",
+        "[v1_0]concat=n=1:v=1:a=0[joined]",
+        f"[joined]{VERTICAL},subtitles=filename='a.srt'[v]",
+    ]
+
+
+def test_graph_without_segments_is_rejected():
+    with pytest.raises(ValueError):
+        jump_cut_filter([SegmentSet()])
+
+
+def test_lines_move_to_the_time_of_the_cut():
+    lines = [
+        {"start": 0.0, "end": 0.5, "text": "cut away"},
+        {"start": 1.5, "end": 2.0, "text": "first"},
+        {"start": 2.0, "end": 5.0, "text": "across the cut"},
+        {"start": 5.5, "end": 6.5, "text": "second"},
+    ]
+
+    moved = jump_cut_lines(lines, SegmentSet([(1, 2.5), (4, 6)]))
+
+    assert [(line["text"], line["start"], line["end"]) for line in moved] == [
+        ("first", 0.5, 1.0),
+        ("across the cut", 1.0, 2.5),
+        ("second", 3.0, 3.5),
+    ]
+
+
+def test_subtitle_options_quote_the_path_and_convert_colours():
+    options = subtitle_options("/tmp/it's.srt", font_size=100, font_colour="#FFFF00", stroke_colour="black", video_height=1080)
+
+    assert options.startswith("filename='/tmp/it'\\''s.srt':fontsdir='../fonts':force_style='")
+    assert "PrimaryColour=&H0000FFFF" in options
+    assert "OutlineColour=&H00000000" in options
+    assert "Fontsize=26.7" in options
@@ -0,0 +1,61 @@
+import wave
+import numpy as np
+import pytest
+
+from audio import ANALYSIS_SAMPLE_RATE
+from live import RollingWindow, SpeechSegmenter
+
+
+def quiet_lead_in(seed=0):
+    # 2 s of faint noise, speech-loud noise from 2 s to 6 s, then faint noise until 8 s
+    rng = np.random.default_rng(seed)
+    y = rng.normal(0, 1e-3, 8 * ANALYSIS_SAMPLE_RATE)
+    y[2 * ANALYSIS_SAMPLE_RATE:6 * ANALYSIS_SAMPLE_RATE] += rng.normal(0, 0.1, 4 * ANALYSIS_SAMPLE_RATE)
+    return y.astype(np.float32)
+
+
+def segment(y, chunk):
+    segmenter = SpeechSegmenter()
+    closed = []
+    for start in range(0, len(y), chunk):
+        closed += segmenter.feed(y[start:start + chunk])
+    return closed + segmenter.flush()
+
+
+@pytest.mark.parametrize("chunk", [1000, ANALYSIS_SAMPLE_RATE])
+def test_quiet_lead_in_is_not_speech(chunk):
+    segments = segment(quiet_lead_in(), chunk)
+
+    assert len(segments) == 1
+    start, end = segments[0]
+    assert start == pytest.approx(2, abs=0.05)
+    assert end == pytest.approx(6, abs=0.05)
+
+
+def test_faint_noise_alone_is_not_speech():
+    y = np.random.default_rng(1).normal(0, 1e-3, 8 * ANALYSIS_SAMPLE_RATE).astype(np.float32)
+
+    assert segment(y, 1000) == []
+
+
+def test_quiet_lead_in_of_a_progressive_download_is_not_speech(tmp_path):
+    # A download processed while it arrives, as `run_progressive_job` does: decoded segment by segment into the rolling window
+    y = quiet_lead_in()
+    seconds = 2
+    segmenter = SpeechSegmenter()
+    window = RollingWindow()
+    closed = []
+    for index, start in enumerate(range(0, len(y), seconds * ANALYSIS_SAMPLE_RATE)):
+        path = str(tmp_path / f"segment_{index}.wav")
+        with wave.open(path, "wb") as file:
+            file.setnchannels(1)
+            file.setsampwidth(2)
+            file.setframerate(ANALYSIS_SAMPLE_RATE)
+            file.writeframes((y[start:start + seconds * ANALYSIS_SAMPLE_RATE] * 32767).astype("<i2").tobytes())
+        closed += segmenter.feed(window.add(path, start / ANALYSIS_SAMPLE_RATE, start / ANALYSIS_SAMPLE_RATE + seconds))
+        window.release(segmenter.open_since if segmenter.open_since is not None else segmenter.time)
+    closed += segmenter.flush()
+
+    assert len(closed) == 1
+    assert closed[0][0] == pytest.approx(2, abs=0.05)
+    assert closed[0][1] == pytest.approx(6, abs=0.05)
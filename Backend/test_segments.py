@@ -0,0 +1,49 @@
+import numpy as np
+
+from segments import SegmentSet
+
+
+def test_merge_joins_overlaps_and_small_gaps():
+    segments = SegmentSet([(5, 6), (0, 2), (1, 3), (3.5, 4), (10, 12), (11, 11.5)])
+
+    assert segments.merge().to_list() == [(0, 3), (3.5, 4), (5, 6), (10, 12)]
+    assert segments.merge(gap=0.5).to_list() == [(0, 4), (5, 6), (10, 12)]
+
+
+def test_merge_keeps_the_end_of_a_segment_containing_later_ones():
+    # A long segment's end reaches past shorter ones that start after it
+    assert SegmentSet([(0, 10), (1, 2), (3, 4), (11, 12)]).merge(gap=1).to_list() == [(0, 12)]
+
+
+def test_invert_returns_the_gaps_within_the_range():
+    segments = SegmentSet([(1, 2), (1.5, 3), (5, 12)])
+
+    assert segments.invert(10).to_list() == [(0, 1), (3, 5)]
+    assert segments.invert(10, start=2).to_list() == [(3, 5)]
+    assert SegmentSet().invert(4).to_list() == [(0, 4)]
+    assert SegmentSet([(0, 4)]).invert(4).to_list() == []
+
+
+def test_pad_widens_and_clip_cuts_to_the_range():
+    padded = SegmentSet([(0.1, 1), (2, 3), (9.8, 10)]).pad(0.25, 0.5)
+
+    np.testing.assert_allclose(padded.bounds, [(-0.15, 1.5), (1.75, 3.5), (9.55, 10.5)])
+    np.testing.assert_allclose(padded.clip(10).bounds, [(0, 1.5), (1.75, 3.5), (9.55, 10)])
+    # Segments left empty by the range are dropped
+    assert padded.clip(3.5, start=1.5).to_list() == [(1.75, 3.5)]
+
+
+def test_empty_set_operations():
+    empty = SegmentSet()
+
+    assert len(empty) == 0
+    assert empty.merge().to_list() == []
+    assert empty.pad(1).clip(10).to_list() == []
+    assert empty.durations.tolist() == []
+
+
+def test_samples_round_trip():
+    segments = SegmentSet.from_samples([(16000, 32000), (48000, 56000)], 16000)
+
+    assert segments.to_list() == [(1, 2), (3, 3.5)]
+    np.testing.assert_array_equal(segments.to_samples(16000), [(16000, 32000), (48000, 56000)])
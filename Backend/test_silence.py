@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+import silence
+from audio import ANALYSIS_SAMPLE_RATE
+from silence import AMIN, FRAME_LENGTH, HOP_LENGTH, SilenceSplitter, split_stream
+
+
+def reference_split(y, top_db=30, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH):
+    # `librosa.effects.split` step by step: centred zero-padded frames, mean-square power, dB against the loudest frame
+    frames = sliding_window_view(np.pad(y, frame_length // 2), frame_length)[::hop_length]
+    mse = np.sqrt(np.mean(np.abs(frames) ** 2, axis=1)) ** 2
+    db = 10 * np.log10(np.maximum(AMIN, mse)) - 10 * np.log10(np.maximum(AMIN, mse.max()))
+    non_silent = db > -top_db
+    edges = np.flatnonzero(np.diff(non_silent.astype(int))) + 1
+    if non_silent[0]:
+        edges = np.insert(edges, 0, 0)
+    if non_silent[-1]:
+        edges = np.append(edges, len(non_silent))
+    return np.minimum(edges * hop_length, len(y)).reshape(-1, 2)
+
+
+def speech_like(seed, seconds=20, dtype=np.float64):
+    # Bursts of noise of random loudness and length between near-silent stretches
+    rng = np.random.default_rng(seed)
+    y = rng.normal(0, 1e-4, int(seconds * ANALYSIS_SAMPLE_RATE))
+    position = int(rng.integers(0, ANALYSIS_SAMPLE_RATE))
+    while position < len(y):
+        length = int(rng.integers(ANALYSIS_SAMPLE_RATE // 20, 2 * ANALYSIS_SAMPLE_RATE))
+        y[position:position + length] += rng.normal(0, rng.uniform(0.01, 0.5), len(y[position:position + length]))
+        position += length + int(rng.integers(ANALYSIS_SAMPLE_RATE // 20, ANALYSIS_SAMPLE_RATE))
+    return y.astype(dtype)
+
+
+def blocks(y, seed):
+    # The signal in blocks of random size, as they arrive from a pipe
+    rng = np.random.default_rng(seed)
+    start = 0
+    while start < len(y):
+        size = int(rng.integers(1, 20000))
+        yield y[start:start + size]
+        start += size
+
+
+def split_blocks(y, seed=0):
+    # Both passes of the splitter over differently sized blocks of the signal
+    splitter = SilenceSplitter(30)
+    reference = splitter.reference(blocks(y, seed))
+    return np.array(list(splitter.split(blocks(y, seed + 100), reference))).reshape(-1, 2), splitter.samples
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_streaming_split_matches_librosa(seed):
+    y = speech_like(seed)
+
+    intervals, samples = split_blocks(y, seed)
+
+    assert samples == len(y)
+    np.testing.assert_array_equal(intervals, reference_split(y))
+
+
+def test_streaming_split_matches_librosa_itself():
+    librosa = pytest.importorskip("librosa")
+    y = speech_like(7)
+
+    intervals, samples = split_blocks(y)
+
+    assert samples == len(y)
+    np.testing.assert_array_equal(intervals, librosa.effects.split(y, top_db=30))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_frame_power_ranges_are_identical_to_streaming(seed):
+    y = speech_like(seed, seconds=5)
+    splitter = SilenceSplitter()
+    streamed = np.concatenate(list(splitter.frame_powers(blocks(y, seed))))
+    frames = len(streamed)
+    rng = np.random.default_rng(seed)
+    cuts = np.sort(rng.choice(np.arange(1, frames), 6, replace=False))
+
+    ranged = np.concatenate([
+        splitter.frame_powers_range(y, first, last)
+        for first, last in zip(np.concatenate([[0], cuts]), np.concatenate([cuts, [frames]]))
+    ])
+
+    np.testing.assert_array_equal(ranged, streamed)
+
+
+@pytest.mark.parametrize("seed, chunk_frames", [(0, 2048), (1, 7), (2, 100), (3, 1)])
+def test_parallel_split_matches_serial(tmp_path, monkeypatch, seed, chunk_frames):
+    path = str(tmp_path / "audio.npy")
+    np.save(path, speech_like(seed, seconds=12, dtype=np.float32))
+    monkeypatch.setattr(silence, "CHUNK_FRAMES", chunk_frames)
+
+    serial = split_stream(path, threads=1)
+    parallel = split_stream(path, threads=4)
+
+    assert parallel == serial
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from audio import ANALYSIS_SAMPLE_RATE
+from silence import SilenceSplitter
+from vad import VoiceActivityDetector
+
+
+def tone_bursts(bursts, seconds=10, amplitude=0.1, seed=0):
+    # Faint noise with a 220 Hz tone in every (start, end, amplitude scale) burst
+    rng = np.random.default_rng(seed)
+    time = np.arange(seconds * ANALYSIS_SAMPLE_RATE) / ANALYSIS_SAMPLE_RATE
+    y = rng.normal(0, 1e-3, len(time))
+    for start, end, scale in bursts:
+        inside = (time >= start) & (time < end)
+        y[inside] += scale * amplitude * np.sin(2 * np.pi * 220 * time[inside])
+    return y
+
+
+def detect(y, **options):
+    powers = np.concatenate(list(SilenceSplitter().frame_powers([y])))
+    return VoiceActivityDetector(**options).segments(powers, len(y) / ANALYSIS_SAMPLE_RATE)
+
+
+def test_short_pauses_are_bridged_and_short_bursts_dropped():
+    # The 0.3 s pause is shorter than min_silence, the 0.5 s burst shorter than min_speech
+    segments = detect(tone_bursts([(2, 4, 1), (4.3, 5, 1), (7, 7.5, 1)]), min_silence=0.6, min_speech=1.0, padding=0.15)
+
+    assert len(segments) == 1
+    start, end = segments.to_list()[0]
+    assert start == pytest.approx(1.85, abs=0.1)
+    assert end == pytest.approx(5.15, abs=0.1)
+
+
+def test_hysteresis_keeps_speech_that_drops_between_the_thresholds():
+    # About 37 dB above the noise, then about 9 dB: below on_db but above off_db
+    y = tone_bursts([(2, 3, 1), (3, 5, 0.04)])
+    segments = detect(y, on_db=12, off_db=6, padding=0)
+
+    assert len(segments) == 1
+    assert segments.ends[0] == pytest.approx(5, abs=0.1)
+    # Without hysteresis the quieter part ends the segment
+    assert detect(y, on_db=12, off_db=12, padding=0).to_list()[0][1] == pytest.approx(3, abs=0.1)
+
+
+def test_padding_is_clipped_to_the_recording():
+    segments = detect(tone_bursts([(0, 2, 1), (8.5, 10, 1)]), padding=0.5)
+
+    assert segments.starts[0] == 0
+    assert segments.ends[-1] == pytest.approx(10)
+
+
+def test_silence_has_no_speech():
+    assert len(detect(tone_bursts([]))) == 0
+
+
+def test_off_threshold_above_on_threshold_is_rejected():
+    with pytest.raises(ValueError):
+        VoiceActivityDetector(on_db=6, off_db=12)
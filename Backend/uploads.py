@@ -0,0 +1,331 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+import subprocess
+
+from termcolor import colored
+from dotenv import load_dotenv
+from imageio_ffmpeg import get_ffmpeg_exe
+from utils import SCRATCH_ROOT
+from source_cache import SourceCache, cache_key
+
+load_dotenv("../.env")
+
+# Directory the unfinished uploads are streamed to, inside the scratch tree
+UPLOADS_DIR = os.path.join(SCRATCH_ROOT, "uploads")
+
+# Largest file that can be uploaded
+UPLOAD_MAX_BYTES = int(float(os.getenv("UPLOAD_MAX_GB", "20")) * 1024 ** 3)
+
+# Upload sessions untouched for this long (in seconds) are discarded
+UPLOAD_EXPIRY_SECONDS = 24 * 3600
+
+# Bytes read from a request body at a time
+CHUNK_BYTES = 1024 * 1024
+
+# Extractor name of uploaded sources, their ID is the SHA-256 of the file
+UPLOAD_EXTRACTOR = "upload"
+
+# IDs of upload sessions and SHA-256 hex digests
+UPLOAD_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+SHA256_PATTERN = re.compile(r"[0-9a-fA-F]{64}")
+
+SESSION = "upload.json"
+PART = "upload.part"
+
+
+class UploadError(Exception):
+    """
+    Raised when an upload request cannot be applied.
+    """
+
+    def __init__(self, message: str, status: int = 400, offset: int = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def upload_cache_key(digest: str) -> str:
+    """
+    Builds the source cache key of an uploaded file.
+
+    Args:
+        digest (str): The SHA-256 of the file.
+
+    Returns:
+        str: The cache key.
+    """
+    return cache_key(UPLOAD_EXTRACTOR, digest)
+
+
+def uploaded_file(digest: str) -> str:
+    """
+    Looks up an uploaded file in the source cache.
+
+    Args:
+        digest (str): The SHA-256 of the file.
+
+    Returns:
+        str: The path of the cached file.
+
+    Raises:
+        FileNotFoundError: If the file has been evicted from the cache.
+    """
+    entry = SourceCache().get(upload_cache_key(digest))
+    if entry is None:
+        raise FileNotFoundError(f"The uploaded file {digest} is no longer cached, upload it again.")
+    return entry["files"]["source"]
+
+
+def probe_file(path: str, digest: str) -> dict:
+    """
+    Reads the duration and video format of a local file, in the shape `probe_source` reports them for URLs.
+
+    Args:
+        path (str): The path to the file.
+        digest (str): The SHA-256 of the file, used as its ID.
+
+    Returns:
+        dict: The 'extractor', 'id', 'duration', 'width', 'height' and 'fps' of the file; values ffmpeg does not report are None.
+
+    Raises:
+        UploadError: If the file contains no video.
+    """
+    # ffmpeg without an output prints the stream info and exits with an error
+    result = subprocess.run([get_ffmpeg_exe(), "-nostdin", "-hide_banner", "-i", path], capture_output=True, text=True)
+    video = re.search(r"Stream #.*?: Video: .*?(\d{2,5})x(\d{2,5})(?:.*?([\d.]+) fps)?", result.stderr)
+    if video is None:
+        raise UploadError("The uploaded file contains no video.", 415)
+    duration = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr)
+    return {
+        "extractor": UPLOAD_EXTRACTOR,
+        "id": digest,
+        "duration": int(duration[1]) * 3600 + int(duration[2]) * 60 + float(duration[3]) if duration else None,
+        "width": int(video[1]),
+        "height": int(video[2]),
+        "fps": float(video[3]) if video[3] else None,
+        "live": False,
+    }
+
+
+class UploadStore:
+    """
+    Resumable chunked uploads of local source files. Every upload is a session whose body is streamed to disk chunk by chunk and hashed on the fly, so neither the file nor the hash has to be held in memory. A finished file is moved into the source cache under its SHA-256; uploading the same file again reuses the cached copy.
+    """
+
+    def __init__(self, root: str = UPLOADS_DIR) -> None:
+        self.root = root
+        self._lock = threading.Lock()
+        self._hashes = {}
+        self._writing = set()
+        os.makedirs(root, exist_ok=True)
+
+    def create(self, filename: str, size: int, digest: str = None) -> dict:
+        """
+        Starts an upload.
+
+        Args:
+            filename (str): The name of the file, for reference only.
+            size (int): The size of the file in bytes.
+            digest (str): Optional SHA-256 of the file; the finished upload is rejected if it does not match. Knowing the digest of a cached file is no proof of having it, so the file is uploaded either way.
+
+        Returns:
+            dict: The status of the upload, as returned by `status`.
+
+        Raises:
+            UploadError: If the size or the digest is invalid or the size exceeds UPLOAD_MAX_BYTES.
+        """
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise UploadError("size must be a positive number of bytes.")
+        if size > UPLOAD_MAX_BYTES:
+            raise UploadError(f"The file is larger than the limit of {UPLOAD_MAX_BYTES / 1024 ** 3:.0f} GB.", 413)
+        if digest is not None and (not isinstance(digest, str) or not SHA256_PATTERN.fullmatch(digest)):
+            raise UploadError("sha256 must be 64 hexadecimal digits.")
+        self.expire()
+
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._path(upload_id))
+        session = {"id": upload_id, "filename": filename, "size": size, "sha256": None, "expected_sha256": digest.lower() if digest else None, "source": None}
+        open(self._path(upload_id, PART), "wb").close()
+        self._save(session)
+        return self.status(upload_id)
+
+    def status(self, upload_id: str) -> dict:
+        """
+        Reports how far an upload has got; clients resume from the returned 'offset'.
+
+        Args:
+            upload_id (str): The ID returned by `create`.
+
+        Returns:
+            dict: The 'uploadId', 'filename', 'size', received 'offset', whether it is 'complete' and, once it is, its 'sha256'.
+
+        Raises:
+            UploadError: If the upload does not exist.
+        """
+        session = self._load(upload_id)
+        complete = session["sha256"] is not None
+        return {
+            "uploadId": upload_id,
+            "filename": session["filename"],
+            "size": session["size"],
+            "offset": session["size"] if complete else os.path.getsize(self._path(upload_id, PART)),
+            "complete": complete,
+            "sha256": session["sha256"],
+        }
+
+    def write(self, upload_id: str, start: int, total: int, stream, length: int) -> dict:
+        """
+        Appends a chunk to an upload, streaming it from the request body to disk.
+
+        Args:
+            upload_id (str): The ID returned by `create`.
+            start (int): The offset of the chunk in the file; it has to continue where the upload stands.
+            total (int): The size of the whole file as sent by the client.
+            stream: The readable request body.
+            length (int): The size of the chunk in bytes.
+
+        Returns:
+            dict: The status of the upload, as returned by `status`.
+
+        Raises:
+            UploadError: If the upload does not exist, the chunk does not fit it or another chunk is being written.
+        """
+        status = self.status(upload_id)
+        with self._lock:
+            if upload_id in self._writing:
+                raise UploadError("Another chunk of this upload is being written.", 409, status["offset"])
+            self._writing.add(upload_id)
+        try:
+            # Checked while holding the upload, so no other chunk can move the offset meanwhile
+            status = self.status(upload_id)
+            if status["complete"]:
+                return status
+            if total != status["size"] or start + length > status["size"]:
+                raise UploadError(f"The chunk does not fit into the {status['size']} bytes of the upload.", 416, status["offset"])
+            if start != status["offset"]:
+                raise UploadError(f"The upload continues at byte {status['offset']}.", 409, status["offset"])
+
+            digest = self._digest(upload_id, start)
+            written = 0
+            try:
+                with open(self._path(upload_id, PART), "ab") as file:
+                    while written < length:
+                        chunk = stream.read(min(CHUNK_BYTES, length - written))
+                        if not chunk:
+                            # The client went away, it resumes from what was written
+                            break
+                        file.write(chunk)
+                        digest.update(chunk)
+                        written += len(chunk)
+            finally:
+                self._hashes[upload_id] = (digest, start + written)
+            if start + written == status["size"]:
+                self._finish(upload_id, digest.hexdigest())
+        finally:
+            with self._lock:
+                self._writing.discard(upload_id)
+        return self.status(upload_id)
+
+    def source(self, upload_id: str) -> dict:
+        """
+        Returns the probed source of a finished upload for submitting a job.
+
+        Args:
+            upload_id (str): The ID returned by `create`.
+
+        Returns:
+            dict: The source, as returned by `probe_file`.
+
+        Raises:
+            UploadError: If the upload does not exist, is not complete or has been evicted from the cache.
+        """
+        session = self._load(upload_id)
+        if session["sha256"] is None:
+            raise UploadError("The upload is not complete yet.", 409)
+        if SourceCache().get(upload_cache_key(session["sha256"])) is None:
+            raise UploadError("The uploaded file is no longer cached, upload it again.", 410)
+        return session["source"]
+
+    def expire(self) -> None:
+        """
+        Removes the sessions that have not been touched for UPLOAD_EXPIRY_SECONDS. Finished files stay in the source cache.
+
+        Returns:
+            None
+        """
+        for upload_id in os.listdir(self.root):
+            path = os.path.join(self.root, upload_id)
+            # Anything else in the directory is not ours to remove
+            if not UPLOAD_ID_PATTERN.fullmatch(upload_id) or not os.path.isdir(path):
+                continue
+            try:
+                touched = max((os.path.getmtime(os.path.join(path, name)) for name in os.listdir(path)), default=os.path.getmtime(path))
+            except OSError:
+                # Removed meanwhile
+                continue
+            if upload_id not in self._writing and time.time() - touched > UPLOAD_EXPIRY_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+                self._hashes.pop(upload_id, None)
+
+    def _digest(self, upload_id: str, offset: int):
+        # The running hash of the received bytes; after a restart or a failed write it is rebuilt from the partial file
+        digest, hashed = self._hashes.get(upload_id, (None, None))
+        if hashed != offset:
+            digest = hashlib.sha256()
+            with open(self._path(upload_id, PART), "rb") as file:
+                for block in iter(lambda: file.read(CHUNK_BYTES), b""):
+                    digest.update(block)
+        return digest
+
+    def _finish(self, upload_id: str, digest: str) -> None:
+        session = self._load(upload_id)
+        part = self._path(upload_id, PART)
+        if session.get("expected_sha256") not in (None, digest):
+            shutil.rmtree(self._path(upload_id), ignore_errors=True)
+            self._hashes.pop(upload_id, None)
+            raise UploadError(f"The uploaded file does not match the announced sha256, its SHA-256 is {digest}.", 422)
+        cache = SourceCache()
+        key = upload_cache_key(digest)
+        with cache.lock(key):
+            entry = cache.get(key)
+            if entry is None:
+                try:
+                    source = probe_file(part, digest)
+                except UploadError:
+                    shutil.rmtree(self._path(upload_id), ignore_errors=True)
+                    raise
+                # The cached file keeps the extension of the upload
+                path = self._path(upload_id, f"source{os.path.splitext(session['filename'])[1].lower()}")
+                os.replace(part, path)
+                entry = cache.put(key, {"source": path}, meta={"filename": session["filename"], "source": source}, digests={"source": digest})
+            else:
+                print(colored(f"[+] {session['filename']} is already cached", "green"))
+                os.remove(part)
+        self._hashes.pop(upload_id, None)
+        session.update(sha256=digest, source=entry["meta"]["source"])
+        self._save(session)
+
+    def _path(self, upload_id: str, name: str = "") -> str:
+        if not UPLOAD_ID_PATTERN.fullmatch(upload_id):
+            raise UploadError("Upload not found.", 404)
+        return os.path.join(self.root, upload_id, name)
+
+    def _load(self, upload_id: str) -> dict:
+        try:
+            with open(self._path(upload_id, SESSION)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            raise UploadError("Upload not found.", 404)
+
+    def _save(self, session: dict) -> None:
+        path = self._path(session["id"], SESSION)
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(session, file)
+        os.replace(f"{path}.tmp", path)
+
@@ -1,16 +1,26 @@
 import os
 import json
 import random
+import shutil
 import logging
 import zipfile
-import requests
 
 from termcolor import colored
+from dotenv import load_dotenv
+from downloads import download
+
+load_dotenv("../.env")
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Root under which every job gets its own scratch tree (point it at a tmpfs such as /dev/shm to keep intermediates in RAM)
+SCRATCH_ROOT = os.getenv("SCRATCH_ROOT", "../temp")
+
+# Sub-directories of a job's scratch tree
+JOB_SUBDIRS = ("source", "clips", "subtitles", "output")
+
 
 def clean_dir(path: str) -> None:
     """
@@ -36,6 +46,53 @@ def clean_dir(path: str) -> None:
     except Exception as e:
         logger.error(f"Error occurred while cleaning directory {path}: {str(e)}")
 
+def job_dirs(job_id: str) -> dict:
+    """
+    Creates (if needed) the scratch tree of a job and returns its paths. Every file a job writes lives below it, so jobs never touch each other's files.
+
+    Args:
+        job_id (str): The ID of the job.
+
+    Returns:
+        dict: The paths of the job's 'root', 'source', 'clips', 'subtitles' and 'output' directories.
+    """
+    root = os.path.join(SCRATCH_ROOT, job_id)
+    dirs = {"root": root}
+    for name in JOB_SUBDIRS:
+        dirs[name] = os.path.join(root, name)
+        os.makedirs(dirs[name], exist_ok=True)
+    return dirs
+
+
+def remove_job_dir(job_id: str, keep_output: bool = False) -> None:
+    """
+    Removes the scratch tree of a job.
+
+    Args:
+        job_id (str): The ID of the job.
+        keep_output (bool): Only remove the intermediate files and keep the job's 'output' directory.
+
+    Returns:
+        None
+    """
+    root = os.path.join(SCRATCH_ROOT, job_id)
+    if not os.path.isdir(root):
+        return
+
+    for name in os.listdir(root):
+        if keep_output and name == "output":
+            continue
+        path = os.path.join(root, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+    if not keep_output:
+        shutil.rmtree(root, ignore_errors=True)
+    logger.info(colored(f"Removed scratch files of job {job_id}", "green"))
+
+
 def fetch_songs(zip_url: str) -> None:
     """
     Downloads songs into songs/ directory to use with geneated videos.
@@ -54,12 +111,8 @@ def fetch_songs(zip_url: str) -> None:
             os.mkdir(files_dir)
             logger.info(colored(f"Created directory: {files_dir}", "green"))
 
-        # Download songs
-        response = requests.get(zip_url)
-
-        # Save the zip file
-        with open("../Songs/songs.zip", "wb") as file:
-            file.write(response.content)
+        # Download songs (streamed to disk, the archive is never held in memory)
+        download(zip_url, "../Songs/songs.zip")
 
         # Unzip the file
         with zipfile.ZipFile("../Songs/songs.zip", "r") as file:
@@ -0,0 +1,80 @@
+import os
+import numpy as np
+
+from dotenv import load_dotenv
+from audio import ANALYSIS_SAMPLE_RATE
+from segments import SegmentSet
+from silence import AMIN, HOP_LENGTH
+
+load_dotenv("../.env")
+
+# Percentile of the frame levels taken as the noise floor of a recording
+VAD_NOISE_PERCENTILE = float(os.getenv("VAD_NOISE_PERCENTILE", "10"))
+
+# Level above the noise floor (in dB) at which speech starts
+VAD_ON_DB = float(os.getenv("VAD_ON_DB", "12"))
+
+# Level above the noise floor (in dB) below which speech ends
+VAD_OFF_DB = float(os.getenv("VAD_OFF_DB", "6"))
+
+# Shortest speech segment (in seconds) worth a clip
+VAD_MIN_SPEECH_SECONDS = float(os.getenv("VAD_MIN_SPEECH_SECONDS", "1.0"))
+
+# Shortest silence (in seconds) that separates two clips; shorter pauses are kept inside a clip
+VAD_MIN_SILENCE_SECONDS = float(os.getenv("VAD_MIN_SILENCE_SECONDS", "0.6"))
+
+# Seconds kept before and after every speech segment so words are not clipped
+VAD_PADDING_SECONDS = float(os.getenv("VAD_PADDING_SECONDS", "0.15"))
+
+
+class VoiceActivityDetector:
+    """
+    Finds speech with an adaptive noise floor and hysteresis instead of a fixed distance to the loudest frame. The floor is a percentile of the frame levels of the whole recording. Speech starts where the level rises `on_db` above the floor and lasts until it falls below `off_db` above it, so a level wavering around a single threshold does not chop speech into pieces. Pauses shorter than `min_silence` are bridged, segments shorter than `min_speech` are dropped and the rest is padded, which leaves far fewer, better-formed segments to render.
+    """
+
+    def __init__(self, noise_percentile: float = VAD_NOISE_PERCENTILE, on_db: float = VAD_ON_DB, off_db: float = VAD_OFF_DB, min_speech: float = VAD_MIN_SPEECH_SECONDS, min_silence: float = VAD_MIN_SILENCE_SECONDS, padding: float = VAD_PADDING_SECONDS, sample_rate: int = ANALYSIS_SAMPLE_RATE, hop_length: int = HOP_LENGTH) -> None:
+        if off_db > on_db:
+            raise ValueError("off_db must not be above on_db.")
+        self.noise_percentile = noise_percentile
+        self.on_db = on_db
+        self.off_db = off_db
+        self.min_speech = min_speech
+        self.min_silence = min_silence
+        self.padding = padding
+        self.sample_rate = sample_rate
+        self.hop_length = hop_length
+
+    def segments(self, frame_powers: np.ndarray, duration: float) -> SegmentSet:
+        """
+        Finds the speech segments of a recording from the powers of its frames.
+
+        Args:
+            frame_powers (np.ndarray): The mean-square power of every centred frame, as computed by `track_frame_powers`.
+            duration (float): The length of the recording in seconds.
+
+        Returns:
+            SegmentSet: The speech segments in seconds.
+        """
+        if not len(frame_powers):
+            return SegmentSet()
+        levels = 10 * np.log10(np.maximum(AMIN, frame_powers))
+        floor = np.percentile(levels, self.noise_percentile)
+        active = levels > floor + self.off_db
+        loud = levels > floor + self.on_db
+
+        # Runs of frames above the off threshold are speech if they reach the on threshold somewhere
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], active.astype(np.int8), [0]])))
+        starts, ends = edges[0::2], edges[1::2]
+        if not len(starts):
+            return SegmentSet()
+        speech = np.add.reduceat(loud, starts) > 0
+        frames = np.column_stack([starts[speech], ends[speech]])
+
+        return (
+            SegmentSet(frames * self.hop_length / self.sample_rate)
+            .merge(gap=self.min_silence)
+            .filter(self.min_speech)
+            .pad(self.padding)
+            .clip(duration)
+            .merge()
+        )
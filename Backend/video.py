@@ -1,7 +1,6 @@
 import os
 import uuid
 
-import requests
 import srt_equalizer
 import assemblyai as aai
 
@@ -12,15 +11,17 @@ from dotenv import load_dotenv
 from datetime import timedelta
 from moviepy.video.fx.all import crop
 from moviepy.video.tools.subtitles import SubtitlesClip
+from utils import SCRATCH_ROOT
+from downloads import download, download_all
 
 load_dotenv("../.env")
 
 ASSEMBLY_AI_API_KEY = os.getenv("ASSEMBLY_AI_API_KEY")
 
 
-def save_video(video_url: str, directory: str = "../temp") -> str:
+def save_video(video_url: str, directory: str = SCRATCH_ROOT) -> str:
     """
-    Saves a video from a given URL and returns the path to the video.
+    Saves a video from a given URL and returns the path to the video. The video is streamed to disk, and an interrupted download is resumed.
 
     Args:
         video_url (str): The URL of the video to save.
@@ -30,11 +31,21 @@ def save_video(video_url: str, directory: str = "../temp") -> str:
         str: The path to the saved video.
     """
     video_id = uuid.uuid4()
-    video_path = f"{directory}/{video_id}.mp4"
-    with open(video_path, "wb") as f:
-        f.write(requests.get(video_url).content)
+    return download(video_url, f"{directory}/{video_id}.mp4")
 
-    return video_path
+
+def save_videos(video_urls: List[str], directory: str = SCRATCH_ROOT) -> List[str]:
+    """
+    Saves several videos in parallel, at most DOWNLOAD_CONCURRENCY at a time.
+
+    Args:
+        video_urls (List[str]): The URLs of the videos to save.
+        directory (str): The path of the temporary directory to save the videos to
+
+    Returns:
+        List[str]: The paths to the saved videos, in the order of `video_urls`.
+    """
+    return download_all([(video_url, f"{directory}/{uuid.uuid4()}.mp4") for video_url in video_urls])
 
 
 def __generate_subtitles_assemblyai(audio_path: str) -> str:
@@ -89,7 +100,7 @@ def __generate_subtitles_locally(sentences: List[str], audio_clips: List[AudioFi
     return "\n".join(subtitles)
 
 
-def generate_subtitles(audio_path: str, sentences: List[str], audio_clips: List[AudioFileClip]) -> str:
+def generate_subtitles(audio_path: str, sentences: List[str], audio_clips: List[AudioFileClip], directory: str = SCRATCH_ROOT) -> str:
     """
     Generates subtitles from a given audio file and returns the path to the subtitles.
 
@@ -97,6 +108,7 @@ def generate_subtitles(audio_path: str, sentences: List[str], audio_clips: List[
         audio_path (str): The path to the audio file to generate subtitles from.
         sentences (List[str]): all the sentences said out loud in the audio clips
         audio_clips (List[AudioFileClip]): all the individual audio clips which will make up the final audio track
+        directory (str): The directory to save the subtitles to
 
     Returns:
         str: The path to the generated subtitles.
@@ -107,7 +119,7 @@ def generate_subtitles(audio_path: str, sentences: List[str], audio_clips: List[
         srt_equalizer.equalize_srt_file(srt_path, srt_path, max_chars)
 
     # Save subtitles
-    subtitles_path = f"../subtitles/{uuid.uuid4()}.srt"
+    subtitles_path = f"{directory}/{uuid.uuid4()}.srt"
 
     if ASSEMBLY_AI_API_KEY is not None and ASSEMBLY_AI_API_KEY != "":
         print(colored("[+] Creating subtitles using AssemblyAI", "blue"))
@@ -130,7 +142,41 @@ def generate_subtitles(audio_path: str, sentences: List[str], audio_clips: List[
     return subtitles_path
 
 
-def combine_videos(video_paths: List[str], max_duration: int, max_clip_duration: int) -> str:
+def generate_timed_subtitles(lines: List[dict], directory: str = SCRATCH_ROOT) -> str:
+    """
+    Writes subtitles from sentences that already carry their timestamps, e.g. the lines of a transcript, so nothing has to be transcribed again.
+
+    Args:
+        lines (List[dict]): The 'start' and 'end' (in seconds, relative to the clip) and the 'text' of every sentence.
+        directory (str): The directory to save the subtitles to
+
+    Returns:
+        str: The path to the generated subtitles.
+    """
+
+    def convert_to_srt_time_format(total_seconds):
+        # Convert total seconds to the SRT time format: HH:MM:SS,mmm
+        milliseconds = round(total_seconds * 1000)
+        return f"{milliseconds // 3600000:02}:{milliseconds // 60000 % 60:02}:{milliseconds // 1000 % 60:02},{milliseconds % 1000:03}"
+
+    subtitles = [
+        f"{i}\n{convert_to_srt_time_format(line['start'])} --> {convert_to_srt_time_format(line['end'])}\n{line['text']}\n"
+        for i, line in enumerate(lines, start=1)
+    ]
+
+    subtitles_path = f"{directory}/{uuid.uuid4()}.srt"
+    with open(subtitles_path, "w") as file:
+        file.write("\n".join(subtitles))
+
+    # Equalize subtitles
+    srt_equalizer.equalize_srt_file(subtitles_path, subtitles_path, 10)
+
+    print(colored("[+] Subtitles generated from the transcript.", "green"))
+
+    return subtitles_path
+
+
+def combine_videos(video_paths: List[str], max_duration: int, max_clip_duration: int, directory: str = SCRATCH_ROOT, logger="bar") -> str:
     """
     Combines a list of videos into one video and returns the path to the combined video.
 
@@ -138,12 +184,14 @@ def combine_videos(video_paths: List[str], max_duration: int, max_clip_duration:
         video_paths (List): A list of paths to the videos to combine.
         max_duration (int): The maximum duration of the combined video.
         max_clip_duration (int): The maximum duration of each clip.
+        directory (str): The directory to save the combined video to
+        logger: The proglog logger reporting the render progress, moviepy's console bar by default
 
     Returns:
         str: The path to the combined video.
     """
     video_id = uuid.uuid4()
-    combined_video_path = f"../temp/{video_id}.mp4"
+    combined_video_path = f"{directory}/{video_id}.mp4"
     
     #required duration of each clip:
     req_dur = max_duration / len(video_paths)
@@ -186,12 +234,12 @@ def combine_videos(video_paths: List[str], max_duration: int, max_clip_duration:
 
     final_clip = concatenate_videoclips(clips)
     final_clip = final_clip.set_fps(30)
-    final_clip.write_videofile(combined_video_path, threads=2)
+    final_clip.write_videofile(combined_video_path, threads=2, logger=logger)
 
     return combined_video_path
 
 
-def generate_video(combined_video_path: str, tts_path: str, subtitles_path: str) -> str:
+def generate_video(combined_video_path: str, tts_path: str, subtitles_path: str, directory: str = SCRATCH_ROOT) -> str:
     """
     This function creates the final video, with subtitles and audio.
 
@@ -199,6 +247,7 @@ def generate_video(combined_video_path: str, tts_path: str, subtitles_path: str)
         combined_video_path (str): The path to the combined video.
         tts_path (str): The path to the text-to-speech audio.
         subtitles_path (str): The path to the subtitles.
+        directory (str): The directory to save the final video to
 
     Returns:
         str: The path to the final video.
@@ -224,6 +273,6 @@ def generate_video(combined_video_path: str, tts_path: str, subtitles_path: str)
     audio = AudioFileClip(tts_path)
     result = result.set_audio(audio)
 
-    result.write_videofile("../temp/output.mp4", threads=2)
+    result.write_videofile(f"{directory}/output.mp4", threads=2)
 
     return "output.mp4"
@@ -1,22 +1,55 @@
-import whisper_timestamped as whisper
+import whisper_timestamped
 import os
+from functools import lru_cache
 from moviepy.editor import VideoFileClip
 import whisper
 
+@lru_cache(maxsize=None)
+def load_model(name="base", device=None):
+    """
+    Loads a whisper model once per process and keeps it warm for every later transcription.
+
+    Args:
+        name (str): The name of the whisper model.
+        device (str): The device to load the model on, whisper's default if None.
+
+    Returns:
+        whisper.Whisper: The loaded model.
+    """
+    return whisper.load_model(name, device=device)
+
 def create_sentences_from_audio(audioFile):
     """
     Generates sentences / captions from a given audio file using whisper ai and returns the result
 
     Args:
-        audioFile (str): The path to the audio file to generate sentence from.
+        audioFile (str | np.ndarray): The path to the audio file to generate sentence from, or its mono float32 samples at 16 kHz.
 
     Returns:
         result: The text generated.
     """
-    model = whisper.load_model("base")
+    model = load_model("base")
     result = model.transcribe(audioFile,fp16=False)
     return result["text"]
 
+def create_timed_sentences_from_audio(audio):
+    """
+    Transcribes a whole recording in a single pass of the warm model, with the timestamps of every sentence aligned to the words by whisper_timestamped.
+
+    Args:
+        audio (np.ndarray): The mono float32 samples of the recording at 16 kHz.
+
+    Returns:
+        list: A dict with the 'start' and 'end' (in seconds) and the 'text' of every sentence, in order.
+    """
+    model = load_model("base")
+    result = whisper_timestamped.transcribe(model, audio, fp16=False)
+    return [
+        {"start": segment["start"], "end": segment["end"], "text": segment["text"].strip()}
+        for segment in result["segments"]
+        if segment["text"].strip()
+    ]
+
 def convert_video_to_audio_moviepy(video_file, output_ext="mp3"):
     """Converts video to audio using MoviePy library
     that uses `ffmpeg` under the hood"""
@@ -54,12 +87,12 @@ def create_transcript_from_audio(audio_file):
     """
     
     # Load the new audio file
-    audio = whisper.load_audio(audio_file)
+    audio = whisper_timestamped.load_audio(audio_file)
 
     # Load the Whisper model
-    model = whisper.load_model("tiny", device="cpu")
+    model = load_model("tiny", device="cpu")
 
     # Transcribe the audio with the specified language
-    result = whisper.transcribe(model, audio, language="en")
+    result = whisper_timestamped.transcribe(model, audio, language="en")
     print(result)
     return result
\ No newline at end of file